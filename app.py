@@ -3,13 +3,19 @@
 import os
 import uuid
 import json
-from flask import Flask, render_template, request, jsonify, make_response
+import queue
+import threading
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, make_response, Response, stream_with_context, g
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from langchain_core.callbacks import BaseCallbackHandler
 
 from graph_setup import graph
 import memory_manager
-from context_manager import ContextManagerLLM
+import memory_cache
+from context_manager import get_context_manager, analysis_cache, reply_cache
 
 # ─── Load environment variables ────────────────────────────────
 load_dotenv()
@@ -21,6 +27,20 @@ app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-
 SESSION_COOKIE_NAME = 'chatbot_session'
 SESSION_DURATION_DAYS = 30
 
+# Background pool for I/O that can overlap the graph run (memory storage,
+# streamed graph runs, etc.)
+background_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="chat-bg")
+
+# Last background memory write per thread_id; the next turn on the same
+# thread waits for it (and its upload) before retrieving memories
+PENDING_WRITE_TIMEOUT = 5  # seconds
+_pending_writes = {}
+_pending_writes_lock = threading.Lock()
+
+# Load every memory + embedding in the background; retrieval falls back to
+# Azure Search until the cache is ready
+memory_cache.start_warming(memory_manager.search_client)
+
 def get_or_create_session_id():
     """Get existing session ID from cookie or create a new one."""
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
@@ -34,58 +54,49 @@ def get_or_create_session_id():
     
     return session_id
 
-@app.route("/")
-def home():
-    response = make_response(render_template("index.html"))
-    
-    # Ensure session cookie is set
-    session_id = get_or_create_session_id()
+def get_thread_id(session_id):
+    """
+    Checkpoint key for this session + client: a 16-char blake2b hex digest
+    instead of the raw "<uuid>_<ip>" string. Computed once per request and
+    cached on flask.g.
+    """
+    if "thread_id" not in g:
+        key = f"{session_id}|{request.remote_addr}".encode("utf-8")
+        g.thread_id = hashlib.blake2b(key, digest_size=8).hexdigest()
+    return g.thread_id
+
+def set_session_cookie(response, session_id):
+    """Attach the long-lived session cookie to a response."""
     response.set_cookie(
         SESSION_COOKIE_NAME,
         session_id,
-        max_age=60*60*24*SESSION_DURATION_DAYS,  # 30 days
+        max_age=60*60*24*SESSION_DURATION_DAYS,
         httponly=True,
         samesite='Lax'
     )
-    
     return response
 
-@app.route("/chat", methods=["POST"])
-def chat():
-    user_msg = request.json.get("message", "").strip()
-    if not user_msg:
-        return jsonify({"error": "no message"}), 400
-
-    # ─── 1) Get session ID from cookie ────────────────────────────
-    session_id = get_or_create_session_id()
+@app.route("/")
+def home():
+    response = make_response(render_template("index.html"))
     
-    # Use a combination of session and IP for thread_id
-    # This provides both persistence and some security
-    thread_id = f"{session_id}_{request.remote_addr}"
-    config = {"configurable": {"thread_id": thread_id}}
-
-    # ─── 2) Get previous state ────────────────────────────────────
-    snapshot = graph.get_state(config)
-    if (
-        not snapshot
-        or not isinstance(snapshot.values, dict)
-        or "messages" not in snapshot.values
-    ):
-        previous_messages = []
-        previous_memories = []
-    else:
-        previous_messages = snapshot.values.get("messages", [])
-        previous_memories = snapshot.values.get("memories", [])
+    # Ensure session cookie is set
+    session_id = get_or_create_session_id()
+    return set_session_cookie(response, session_id)
 
-    # ─── 3) Prepare state for the context-aware graph ────────────
+def build_input_state(user_msg, session_id, thread_id):
+    """
+    Build the per-turn graph input. Only this turn's values are passed; the
+    checkpointer merges them into the saved thread state (messages are appended
+    by the state reducer), so no separate get_state round-trip is needed.
+    """
     print(f"\n{'='*60}")
     print(f"🗣️  User: {user_msg}")
     print(f"📋 Session: {session_id[:8]}...")
     print(f"{'='*60}\n")
     
-    input_state = {
-        "messages": previous_messages + [f"User: {user_msg}"],
-        "memories": previous_memories,
+    return {
+        "messages": [f"User: {user_msg}"],
         "current_query": user_msg,
         "thread_id": thread_id,
         "session_id": session_id,  # Pass session ID
@@ -97,7 +108,39 @@ def chat():
         "dynamic_prompt": ""
     }
 
-    # ─── 4) Run the context-aware graph workflow ─────────────────
+@app.route("/chat", methods=["POST"])
+def chat():
+    user_msg = request.json.get("message", "").strip()
+    if not user_msg:
+        return jsonify({"error": "no message"}), 400
+
+    # ─── 1) Get session ID from cookie ────────────────────────────
+    session_id = get_or_create_session_id()
+    
+    # Use a combination of session and IP for thread_id
+    # This provides both persistence and some security
+    thread_id = get_thread_id(session_id)
+    config = {"configurable": {"thread_id": thread_id}}
+
+    # A fact stated last turn must be searchable before this turn retrieves
+    wait_for_pending_write(thread_id)
+
+    # Store the user message in the background; its fact analysis, embedding
+    # and upload overlap the graph's retrieval and LLM calls below and may
+    # finish after the reply has been sent
+    submit_memory_write(thread_id, user_msg)
+
+    # A repeat of a recent weather question on this thread is answered from the
+    # reply cache; the turn is still tracked and checkpointed like a graph run
+    cache_key = reply_cache.make_key(thread_id, user_msg)
+    answer = replay_cached_reply(cache_key, user_msg, session_id, thread_id, config)
+    if answer is not None:
+        return set_session_cookie(make_response(jsonify({"reply": answer})), session_id)
+
+    # ─── 2) Get previous state and prepare graph input ───────────
+    input_state = build_input_state(user_msg, session_id, thread_id)
+
+    # ─── 3) Run the context-aware graph workflow ─────────────────
     try:
         # This will run through: context_analyze → enhanced_analyze → context_search → context_respond
         result = graph.invoke(input_state, config)
@@ -105,24 +148,13 @@ def chat():
         # Extract the response
         answer = result.get("response", "I apologize, but I couldn't generate a response.")
         
-        # Update conversation history
-        result["messages"].append(f"Assistant: {answer}")
-        
-        # The graph automatically saves state via checkpointer
+        # The graph automatically saves state (including the assistant line) via checkpointer
+        remember_reply(cache_key, result)
         
         print(f"\n{'='*60}\n")
         
         # Create response with session cookie
-        response = make_response(jsonify({"reply": answer}))
-        response.set_cookie(
-            SESSION_COOKIE_NAME,
-            session_id,
-            max_age=60*60*24*SESSION_DURATION_DAYS,
-            httponly=True,
-            samesite='Lax'
-        )
-        
-        return response
+        return set_session_cookie(make_response(jsonify({"reply": answer})), session_id)
         
     except Exception as e:
         print(f"❌ Error in graph execution: {e}")
@@ -130,14 +162,155 @@ def chat():
         traceback.print_exc()
         return jsonify({"error": "An error occurred processing your request"}), 500
 
+class TokenQueueHandler(BaseCallbackHandler):
+    """Forwards streamed LLM tokens from the graph thread to the HTTP response."""
+    
+    def __init__(self, tokens: queue.Queue):
+        self.tokens = tokens
+    
+    def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.tokens.put(token)
+
+def _sse(data, event=None):
+    """Format one Server-Sent Events message."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Same workflow as /chat, but streams the answer tokens as Server-Sent Events."""
+    user_msg = request.json.get("message", "").strip()
+    if not user_msg:
+        return jsonify({"error": "no message"}), 400
+
+    session_id = get_or_create_session_id()
+    thread_id = get_thread_id(session_id)
+    config = {"configurable": {"thread_id": thread_id}}
+
+    wait_for_pending_write(thread_id)
+
+    # Memory storage never blocks the end of the stream; failures are only logged
+    submit_memory_write(thread_id, user_msg)
+
+    cache_key = reply_cache.make_key(thread_id, user_msg)
+    answer = replay_cached_reply(cache_key, user_msg, session_id, thread_id, config)
+    if answer is not None:
+        # One token event with the whole answer, then the usual done event
+        cached_events = _sse({"token": answer}) + _sse({"reply": answer}, event="done")
+        response = Response(cached_events, mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        return set_session_cookie(response, session_id)
+
+    input_state = build_input_state(user_msg, session_id, thread_id)
+
+    # Run the graph in the background; the response node streams its LLM
+    # tokens into this queue through the callback handler
+    tokens = queue.Queue()
+    
+    def run_graph():
+        try:
+            return graph.invoke(
+                input_state,
+                {**config, "callbacks": [TokenQueueHandler(tokens)]}
+            )
+        finally:
+            tokens.put(None)
+    
+    graph_future = background_executor.submit(run_graph)
+    
+    def generate():
+        while True:
+            token = tokens.get()
+            if token is None:
+                break
+            yield _sse({"token": token})
+        
+        try:
+            result = graph_future.result()
+            answer = result.get("response", "I apologize, but I couldn't generate a response.")
+            remember_reply(cache_key, result)
+            yield _sse({"reply": answer}, event="done")
+        except Exception as e:
+            print(f"❌ Error in graph execution: {e}")
+            import traceback
+            traceback.print_exc()
+            yield _sse({"error": "An error occurred processing your request"}, event="error")
+        
+        print(f"\n{'='*60}\n")
+    
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return set_session_cookie(response, session_id)
+
+def replay_cached_reply(cache_key, user_msg, session_id, thread_id, config):
+    """
+    The cached reply for cache_key (None on a miss or an uncached query). A hit
+    is tracked and checkpointed the way a graph run would record the turn.
+    """
+    cached = reply_cache.get(cache_key) if cache_key else None
+    if cached is None:
+        return None
+    
+    answer, sources = cached
+    print(f"♻️ Reusing recent reply for: {user_msg[:50]}...")
+    try:
+        get_context_manager(thread_id, session_id).track_response(user_msg, answer, sources)
+        graph.update_state(config, {"messages": [f"User: {user_msg}", f"Assistant: {answer}"]})
+    except Exception as e:
+        print(f"⚠️ Could not record cached turn: {e}")
+    return answer
+
+def remember_reply(cache_key, result):
+    """Cache a graph run's reply and web sources when its query is cacheable."""
+    if cache_key and result.get("response"):
+        sources = [r.get("url", "") for r in result.get("web_results") or []]
+        reply_cache.set(cache_key, (result["response"], sources))
+
+def _wait_for_store(future, timeout=None):
+    """Wait for a background memory store; a failed store never fails the request."""
+    try:
+        future.result(timeout=timeout)
+    except Exception as e:
+        print(f"❌ Error storing user message: {e}")
+
+def submit_memory_write(thread_id, user_msg):
+    """
+    Store the user message in the background. store_memory only analyzes the
+    message and queues it; memory_manager uploads the queued batches in order.
+    The future is kept so the thread's next turn can wait for it.
+    """
+    future = background_executor.submit(
+        memory_manager.store_memory, user_msg, memory_type="user_message"
+    )
+    future.add_done_callback(_wait_for_store)
+    
+    with _pending_writes_lock:
+        _pending_writes[thread_id] = future
+    return future
+
+def wait_for_pending_write(thread_id):
+    """
+    Wait for this thread's previous memory write, then upload whatever it
+    queued, so facts from the last turn are visible to this turn's retrieval.
+    """
+    with _pending_writes_lock:
+        previous = _pending_writes.pop(thread_id, None)
+    if previous is None:
+        return
+    
+    _wait_for_store(previous, timeout=PENDING_WRITE_TIMEOUT)
+    memory_manager.flush_pending_memories()
+
 @app.route("/session/info", methods=["GET"])
 def session_info():
     """Get current session information."""
     session_id = get_or_create_session_id()
-    thread_id = f"{session_id}_{request.remote_addr}"
+    thread_id = get_thread_id(session_id)
     
     # Get context manager to check conversation history
-    context_manager = ContextManagerLLM(thread_id, session_id)
+    context_manager = get_context_manager(thread_id, session_id)
     topics = context_manager.tracker.get_all_topics()
     interaction_count = context_manager.tracker.get_interaction_count()
     
@@ -159,10 +332,10 @@ def clear_session():
 def debug_conversation_summary():
     """Get conversation summary for debugging."""
     session_id = get_or_create_session_id()
-    thread_id = f"{session_id}_{request.remote_addr}"
+    thread_id = get_thread_id(session_id)
     topic = request.args.get("topic", None)
     
-    context_manager = ContextManagerLLM(thread_id, session_id)
+    context_manager = get_context_manager(thread_id, session_id)
     summary = context_manager.get_conversation_summary(topic)
     
     return jsonify({
@@ -175,13 +348,13 @@ def debug_conversation_summary():
 def debug_shared_facts():
     """Get shared facts for a topic."""
     session_id = get_or_create_session_id()
-    thread_id = f"{session_id}_{request.remote_addr}"
+    thread_id = get_thread_id(session_id)
     topic = request.args.get("topic", "")
     
     if not topic:
         return jsonify({"error": "provide ?topic=something"})
     
-    context_manager = ContextManagerLLM(thread_id, session_id)
+    context_manager = get_context_manager(thread_id, session_id)
     facts = context_manager.tracker.get_shared_facts(topic)
     
     return jsonify({
@@ -202,13 +375,13 @@ def debug_shared_facts():
 def debug_conversation_history():
     """Get conversation history for a topic."""
     session_id = get_or_create_session_id()
-    thread_id = f"{session_id}_{request.remote_addr}"
+    thread_id = get_thread_id(session_id)
     topic = request.args.get("topic", "")
     
     if not topic:
         return jsonify({"error": "provide ?topic=something"})
     
-    context_manager = ContextManagerLLM(thread_id, session_id)
+    context_manager = get_context_manager(thread_id, session_id)
     history = context_manager.tracker.get_conversation_history(topic)
     
     return jsonify({
@@ -222,9 +395,9 @@ def debug_conversation_history():
 def debug_user_preferences():
     """Get user preferences."""
     session_id = get_or_create_session_id()
-    thread_id = f"{session_id}_{request.remote_addr}"
+    thread_id = get_thread_id(session_id)
     
-    context_manager = ContextManagerLLM(thread_id, session_id)
+    context_manager = get_context_manager(thread_id, session_id)
     preferences = context_manager.tracker.get_user_preferences()
     
     return jsonify({
@@ -237,9 +410,9 @@ def debug_user_preferences():
 def debug_topics():
     """Get all topics discussed."""
     session_id = get_or_create_session_id()
-    thread_id = f"{session_id}_{request.remote_addr}"
+    thread_id = get_thread_id(session_id)
     
-    context_manager = ContextManagerLLM(thread_id, session_id)
+    context_manager = get_context_manager(thread_id, session_id)
     topics = context_manager.tracker.get_all_topics()
     
     summaries = {}
@@ -257,6 +430,21 @@ def debug_topics():
         "topics": summaries
     })
 
+@app.route("/debug/embed-cache", methods=["GET"])
+def debug_embed_cache():
+    """Get hit-rate statistics for the embedding cache used by memory storage and retrieval."""
+    return jsonify(memory_manager.embedding_cache.stats())
+
+@app.route("/debug/analysis-cache", methods=["GET"])
+def debug_analysis_cache():
+    """Get hit-rate statistics for the LLM query analysis cache."""
+    return jsonify(analysis_cache.stats())
+
+@app.route("/debug/reply-cache", methods=["GET"])
+def debug_reply_cache():
+    """Get hit-rate statistics for the weather reply cache (/chat and /chat/stream)."""
+    return jsonify(reply_cache.stats())
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint with context manager status."""
@@ -267,10 +455,12 @@ def health():
             # Try a simple search to verify connection
             results = memory_manager.search_client.search(
                 search_text="*",
-                top=1
+                top=1,
+                select=["id"],
+                include_total_count=False
             )
-            # Force evaluation by converting to list
-            list(results)
+            # Force evaluation with a single round trip
+            next(iter(results), None)
             azure_status = "✅ Connected"
     except:
         azure_status = "❌ Connection failed"
@@ -307,6 +497,7 @@ if __name__ == "__main__":
     print(f"🔧 Session Management: ✅ Cookie-based (30-day persistence)")
     print("\n📍 Endpoints:")
     print("   Main: http://localhost:5000")
+    print("   Streaming Chat: POST /chat/stream (Server-Sent Events)")
     print("   Session Info: /session/info")
     print("   Clear Session: /session/clear")
     print("\n🔍 Debug endpoints:")
@@ -315,6 +506,8 @@ if __name__ == "__main__":
     print("   - /debug/conversation-history?topic=required")
     print("   - /debug/user-preferences")
     print("   - /debug/topics")
+    print("   - /debug/embed-cache")
+    print("   - /debug/analysis-cache")
     print("   - /health")
     print("\n✨ Key Improvements in v2.0:")
     print("   - 🍪 Cookie-based sessions (30-day persistence)")
@@ -7,6 +7,7 @@ from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.models import VectorizedQuery
 
 from openai import OpenAI
+from http_pool import SHARED_HTTP
 from langchain.schema import BaseRetriever, Document
 from pydantic import PrivateAttr
 
@@ -47,7 +48,7 @@ class AzureSearchRetriever(BaseRetriever):
             credential=AzureKeyCredential(api_key)
         )
         self._k = k
-        self._openai = OpenAI()  # uses OPENAI_API_KEY from env
+        self._openai = OpenAI(http_client=SHARED_HTTP)  # uses OPENAI_API_KEY from env
 
     def get_relevant_documents(self, query: str) -> List[Document]:
         """
@@ -4,7 +4,10 @@ Simple Azure Search retriever without Pydantic complications.
 """
 
 import os
-from typing import List
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 
 from azure.search.documents import SearchClient
@@ -14,9 +17,56 @@ from azure.search.documents.models import VectorizedQuery
 from openai import OpenAI
 from langchain.schema import Document
 
+from http_pool import SHARED_HTTP
+from memory_manager import EMBEDDING_MODEL, EMBED_KWARGS
+
 # Load environment variables
 load_dotenv()
 
+# Shared OpenAI client so the embedding cache below can live outside the class
+_openai_client: Optional[OpenAI] = None
+
+def _get_openai_client() -> OpenAI:
+    """Return the process-wide OpenAI client, creating it on first use."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(http_client=SHARED_HTTP)  # uses OPENAI_API_KEY from env
+    return _openai_client
+
+# Query embeddings, LRU-bounded, keyed by the case/whitespace-normalized query
+EMBED_CACHE_SIZE = 1024
+_embed_cache: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+_embed_lock = threading.Lock()
+
+def _embed(query: str) -> Tuple[float, ...]:
+    """
+    Embed a query exactly as written.
+
+    Cached under the normalized query so repeats that differ only in case or
+    spacing skip the OpenAI round trip; returns a tuple so cached vectors
+    can't be mutated by callers.
+    """
+    key = " ".join(query.lower().split())
+    with _embed_lock:
+        vec = _embed_cache.get(key)
+        if vec is not None:
+            _embed_cache.move_to_end(key)
+            return vec
+    
+    # Same model/dimensions as the stored contentVectors (see memory_manager)
+    resp = _get_openai_client().embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=query,
+        **EMBED_KWARGS
+    )
+    vec = tuple(resp.data[0].embedding)
+    
+    with _embed_lock:
+        _embed_cache[key] = vec
+        while len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+    return vec
+
 class SimpleAzureSearchRetriever:
     """
     Simple retriever that uses Azure Cognitive Search vector search.
@@ -28,7 +78,8 @@ class SimpleAzureSearchRetriever:
         endpoint: str,
         api_key: str,
         index_name: str,
-        k: int = 3
+        k: int = 3,
+        k_candidates: Optional[int] = None
     ):
         """
         Initialize the Azure Search client and the OpenAI client.
@@ -38,11 +89,14 @@ class SimpleAzureSearchRetriever:
             api_key: Admin or query key for Azure Search
             index_name: Name of the index to search against
             k: Number of top results to return
+            k_candidates: Nearest neighbours the ANN stage considers before
+                the client-side dedup and top-k cut (defaults to k * 4)
         """
         self.endpoint = endpoint
         self.api_key = api_key
         self.index_name = index_name
         self.k = k
+        self.k_candidates = max(k_candidates or k * 4, k)
         
         # Initialize clients
         self.client = SearchClient(
@@ -50,48 +104,57 @@ class SimpleAzureSearchRetriever:
             index_name=index_name,
             credential=AzureKeyCredential(api_key)
         )
-        self.openai = OpenAI()  # uses OPENAI_API_KEY from env
+        self.openai = _get_openai_client()
 
-    def get_relevant_documents(self, query: str) -> List[Document]:
+    def get_relevant_documents(self, query: str, filter_expr: Optional[str] = None) -> List[Document]:
         """
         Retrieve semantically relevant documents from Azure Search.
 
         Args:
             query: The input query string.
+            filter_expr: Optional OData filter (e.g. "memoryCategory eq 'personal_fact'")
+                applied before the ANN search so only matching documents are scanned.
 
         Returns:
             A list of LangChain Document instances.
         """
         try:
-            # 1) Create embedding
-            resp = self.openai.embeddings.create(
-                model="text-embedding-ada-002",
-                input=query
-            )
-            q_vec = resp.data[0].embedding
+            # 1) Create embedding (cached on the normalized query)
+            q_vec = list(_embed(query))
 
             # 2) Build VectorizedQuery with the correct field
             vq = VectorizedQuery(
                 vector=q_vec,
-                k_nearest_neighbors=self.k,
-                fields="contentVector"
+                k_nearest_neighbors=self.k_candidates,
+                fields="contentVector",
+                exhaustive=False
             )
 
-            # 3) Execute vector search
+            # 3) Execute vector search (filter is applied before ANN)
             results = self.client.search(
                 search_text="*",
-                vector_queries=[vq]
+                vector_queries=[vq],
+                filter=filter_expr,
+                top=self.k_candidates,
+                select=["id", "content"]  # only deserialize the fields we use
             )
 
-            # 4) Wrap hits in Documents
+            # 4) Wrap hits in Documents, dropping duplicate content, until k are kept
             docs: List[Document] = []
+            seen = set()
             for r in results:
+                content = r["content"]
+                if content in seen:
+                    continue
+                seen.add(content)
                 docs.append(
                     Document(
-                        page_content=r.get("content", ""),
-                        metadata={"id": r.get("id", "")}
+                        page_content=content,
+                        metadata={"id": r["id"], "score": r["@search.score"]}
                     )
                 )
+                if len(docs) >= self.k:
+                    break
             return docs
             
         except Exception as e:
@@ -99,14 +162,21 @@ class SimpleAzureSearchRetriever:
             return []
     
     # Methods for LangChain compatibility
-    def invoke(self, query: str) -> List[Document]:
+    def invoke(self, query: str, filter_expr: Optional[str] = None) -> List[Document]:
         """LangChain compatible invoke method."""
-        return self.get_relevant_documents(query)
+        return self.get_relevant_documents(query, filter_expr)
     
     def _get_relevant_documents(self, query: str) -> List[Document]:
         """LangChain compatible method."""
         return self.get_relevant_documents(query)
     
+    async def aget_relevant_documents(self, query: str, filter_expr: Optional[str] = None) -> List[Document]:
+        """
+        Async retrieval that runs the blocking embed + search in a worker thread,
+        so callers can gather it with other I/O instead of stalling the event loop.
+        """
+        return await asyncio.to_thread(self.get_relevant_documents, query, filter_expr)
+    
     async def _aget_relevant_documents(self, query: str) -> List[Document]:
         """Async version for compatibility."""
-        return self.get_relevant_documents(query)
+        return await self.aget_relevant_documents(query)
@@ -1,8 +1,9 @@
 # chat_engine.py
 from openai import OpenAI
+from http_pool import SHARED_HTTP
 from memory_manager import retrieve_memories, store_memory
 
-openai_client = OpenAI()
+openai_client = OpenAI(http_client=SHARED_HTTP)
 
 SYSTEM_PROMPT = """
 You are a helpful assistant. Only use the facts given in 'Memories:' to answer.
@@ -12,7 +13,7 @@ If none are relevant, say "I don't recall that."
 def build_prompt(user_input, memories):
     messages = [{"role":"system","content":SYSTEM_PROMPT.strip()}]
     if memories:
-        mem_lines = "\n".join(f"- [{m['category']}] {m['summary']}" for m in memories)
+        mem_lines = "\n".join(f"- [{m.category}] {m.summary}" for m in memories)
         messages.append({"role":"assistant","content":"Memories:\n" + mem_lines})
     else:
         messages.append({"role":"assistant","content":"Memories:\n- None"})
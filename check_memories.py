@@ -15,17 +15,17 @@ if memories:
     for i, mem in enumerate(memories, 1):
         print(f"\n{'='*60}")
         print(f"Memory #{i}")
-        print(f"Category: {mem.get('category')}")
-        print(f"Score: {mem.get('score', 0):.3f}")
+        print(f"Category: {mem.category}")
+        print(f"Score: {mem.score:.3f}")
         
-        content = mem.get('content', '')
+        content = mem.content
         print(f"\nContent preview (500 chars):")
         print("-" * 60)
         print(content[:500])
         print("-" * 60)
         
         # Check for actual weather data
-        if mem.get('category') == 'web_content':
+        if mem.category == 'web_content':
             content_lower = content.lower()
             print("\n🔍 Content analysis:")
             print(f"- Has temperature: {'°' in content or 'degrees' in content_lower}")
@@ -5,6 +5,7 @@ Run this when you notice the system has cached incorrect information.
 """
 
 import os
+import re
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from dotenv import load_dotenv
@@ -17,6 +18,19 @@ INDEX_NAME = os.getenv("AZURE_INDEX_NAME")
 
 search_client = SearchClient(AZ_ENDPOINT, INDEX_NAME, AzureKeyCredential(AZ_KEY))
 
+# Azure Search accepts at most 1000 documents per indexing request
+DELETE_BATCH_SIZE = 1000
+
+# Locations that must never appear in Tokyo weather content; compiled into a
+# single alternation so each document is scanned once however many there are
+BAD_LOCATION_PATTERNS = ["minnesota"]
+BAD_LOCATION_RE = re.compile("|".join(re.escape(p) for p in BAD_LOCATION_PATTERNS), re.IGNORECASE)
+
+def delete_ids(doc_ids):
+    """Delete a batch of documents by ID, returning how many deletions succeeded."""
+    result = search_client.delete_documents(documents=[{"id": doc_id} for doc_id in doc_ids])
+    return sum(1 for r in result if r.succeeded)
+
 def find_and_remove_bad_tokyo_content():
     """Find and remove Tokyo weather content that actually contains Minnesota information."""
     
@@ -33,11 +47,10 @@ def find_and_remove_bad_tokyo_content():
     bad_content_ids = []
     
     for result in results:
-        content = result.get("content", "").lower()
-        summary = result.get("memorySummary", "").lower()
+        text = f"{result.get('content', '')} {result.get('memorySummary', '')}"
         
         # Check if content mentions wrong locations
-        if 'minnesota' in content or 'minnesota' in summary:
+        if BAD_LOCATION_RE.search(text):
             print(f"❌ Found bad content (ID: {result['id']}): {result.get('memorySummary', '')[:100]}...")
             bad_content_ids.append(result["id"])
     
@@ -45,10 +58,10 @@ def find_and_remove_bad_tokyo_content():
         print(f"🗑️  Removing {len(bad_content_ids)} bad content items...")
         
         # Delete bad content
-        documents_to_delete = [{"id": doc_id} for doc_id in bad_content_ids]
-        result = search_client.delete_documents(documents=documents_to_delete)
-        
-        successful_deletions = sum(1 for r in result if r.succeeded)
+        successful_deletions = sum(
+            delete_ids(bad_content_ids[i:i + DELETE_BATCH_SIZE])
+            for i in range(0, len(bad_content_ids), DELETE_BATCH_SIZE)
+        )
         print(f"✅ Successfully removed {successful_deletions} bad content items")
     else:
         print("✅ No bad Tokyo weather content found")
@@ -71,15 +84,26 @@ def remove_all_web_content():
         select=["id"]
     )
     
-    web_content_ids = [result["id"] for result in results]
+    # Stream IDs page by page and delete in batches instead of
+    # materializing every result up front
+    found = 0
+    successful_deletions = 0
+    batch = []
+    for page in results.by_page():
+        for result in page:
+            batch.append(result["id"])
+            if len(batch) == DELETE_BATCH_SIZE:
+                found += len(batch)
+                print(f"🗑️  Removing {len(batch)} web content items...")
+                successful_deletions += delete_ids(batch)
+                batch = []
     
-    if web_content_ids:
-        print(f"🗑️  Removing {len(web_content_ids)} web content items...")
-        
-        documents_to_delete = [{"id": doc_id} for doc_id in web_content_ids]
-        result = search_client.delete_documents(documents=documents_to_delete)
-        
-        successful_deletions = sum(1 for r in result if r.succeeded)
+    if batch:
+        found += len(batch)
+        print(f"🗑️  Removing {len(batch)} web content items...")
+        successful_deletions += delete_ids(batch)
+    
+    if found:
         print(f"✅ Successfully removed {successful_deletions} web content items")
     else:
         print("✅ No web content found to remove")
@@ -6,21 +6,30 @@ Fixed: Better LLM handling, query classification, and personal fact detection.
 """
 
 import os
-import json
+import re
+import asyncio
+import weakref
+import queue
+import atexit
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass, asdict
-from collections import defaultdict
+from dataclasses import dataclass
+from collections import defaultdict, OrderedDict, deque
 import hashlib
+import threading
 import time
+from functools import lru_cache
 
 from langchain_chat_compat import ChatOpenAI
+from http_pool import SHARED_HTTP
 from langchain.schema import SystemMessage, HumanMessage
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from conversation_tracker import ConversationTracker, SharedFact
+from conversation_tracker import ConversationTracker, SharedFact, TrackingJob
 import memory_manager
+from ttl_cache import TTLLRUCache
+from json_compat import loads as _json_loads, dumps_sorted as _json_dumps_sorted
 
 load_dotenv()
 
@@ -40,6 +49,213 @@ class QueryAnalysis:
     exclude_facts: List[str]
     is_personal_query: bool  # New field
 
+ANALYSIS_MODEL = "gpt-3.5-turbo-1106"  # 1106+ supports JSON mode (response_format)
+
+# Simplified, more reliable prompt
+ANALYSIS_SYSTEM_PROMPT = """Analyze the user query and provide a JSON response.
+
+Return EXACTLY this JSON structure:
+{
+    "enhanced_query": "the query enhanced with any user context",
+    "query_type": "personal_fact|news|weather|stock|temporal_update|general",
+    "temporal_requirement": "immediate|recent|update_since_last|none",
+    "search_constraints": [],
+    "information_gaps": [],
+    "user_intent": "what the user wants to know",
+    "requires_search": true/false,
+    "prompt_instructions": "instructions for the assistant"
+}
+
+Rules:
+- If query is about user's personal info (name, favorite color, etc), set query_type="personal_fact" and requires_search=false
+- If query contains "new", "update", "latest", "recent", set temporal_requirement="update_since_last"
+- Only set requires_search=true if web search is needed
+- Keep responses simple and direct"""
+
+_ANALYSIS_PROMPT_HASH = hashlib.sha1(ANALYSIS_SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+
+# Fallback for replies that wrap the JSON object in prose
+_JSON_EXTRACT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+class LLMAnalysisCache(TTLLRUCache):
+    """
+    Exact-match cache for LLM query analyses (the parsed JSON the model returns).
+    The analysis runs at temperature 0, so identical inputs give identical output;
+    entries are LRU-bounded and expire after `ttl` seconds.
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        super().__init__(max_size, ttl)
+    
+    @staticmethod
+    def make_key(user_prompt: str) -> str:
+        """Key on the model, the system prompt and the rendered user prompt, i.e. every input the model sees."""
+        payload = {"model": ANALYSIS_MODEL, "sys": _ANALYSIS_PROMPT_HASH, "prompt": user_prompt}
+        return hashlib.sha256(_json_dumps_sorted(payload)).hexdigest()
+
+# Shared by every ContextManagerLLM instance
+analysis_cache = LLMAnalysisCache()
+
+# Rule-based classifications at or above this confidence skip the LLM analysis
+RULE_CONFIDENCE_THRESHOLD = 0.8
+NEWS_KEYWORDS = ("ceo", "resignation", "news")
+
+# Whole words only: "Stockholm" isn't a stock query and "newsletter" isn't news
+_NEWS_RE = re.compile(r"\b(?:ceo|resignation|news)\b")
+_WEATHER_RE = re.compile(r"\bweather\b")
+_STOCK_RE = re.compile(r"\bstocks?\b")
+_OUR_RE = re.compile(r"\bour\b", re.IGNORECASE)
+
+@lru_cache(maxsize=2048)
+def _classify_keywords(query_lower: str) -> Tuple[str, float]:
+    """Keyword-based query type and confidence for a lowercased query."""
+    if _NEWS_RE.search(query_lower):
+        return "news", 0.9
+    if _WEATHER_RE.search(query_lower):
+        return "weather", 0.9
+    if _STOCK_RE.search(query_lower):
+        return "stock", 0.9
+    return "general", 0.0
+
+# Personal query patterns
+PERSONAL_PATTERNS = {
+    "name": ["what is my name", "who am i", "my name"],
+    "color": ["what is my favorite color", "my favorite color", "my fav color", 
+             "which color do i like", "what color do i like", "what is my fav color"],
+    "work": ["where do i work", "what company", "my company", "who do i work for"],
+    "location": ["where do i live", "where am i from", "my location"],
+    "preference": ["what do i like", "my favorite", "my preference"]
+}
+
+# All phrases in one alternation; the named group that matched gives the fact type
+PERSONAL_RE = re.compile("|".join(
+    f"(?P<{fact_type}_{i}>{re.escape(pattern)})"
+    for fact_type, patterns in PERSONAL_PATTERNS.items()
+    for i, pattern in enumerate(patterns)
+))
+PERSONAL_PRONOUNS = frozenset(["my", "i", "me"])
+PERSONAL_ATTRIBUTES = frozenset(["favorite", "name", "work", "live", "like"])
+_WORD_RE = re.compile(r"[a-z']+")
+
+@lru_cache(maxsize=4096)
+def _classify_personal_query(query: str) -> Tuple[bool, str]:
+    """Single regex scan for personal fact phrases, then a word-set check for generic ones."""
+    query_lower = query.lower().strip()
+    
+    match = PERSONAL_RE.search(query_lower)
+    if match:
+        return True, match.lastgroup.rsplit("_", 1)[0]
+    
+    # Check for generic personal queries
+    words = set(_WORD_RE.findall(query_lower))
+    if words & PERSONAL_PRONOUNS and words & PERSONAL_ATTRIBUTES and "?" in query:
+        return True, "personal"
+    
+    return False, ""
+
+# Fact extraction from responses (compiled once, case-insensitive)
+MAX_FACTS_PER_RESPONSE = 5
+MAX_SESSION_FACTS = 256  # most recent facts kept per ContextManagerLLM
+_NEGATIVE_RESPONSE_RE = re.compile(r"don't have|no new|not available", re.IGNORECASE)
+_NAME_RE = re.compile(r"name is (\w+)", re.IGNORECASE)
+_COLOR_RE = re.compile(r"favorite color is (\w+)", re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"[^.]+")
+_FACT_INDICATOR_RE = re.compile(r"\b(?:is|are|was|were|will|has|have)\b", re.IGNORECASE)
+_META_STATEMENT_RE = re.compile(r"i don't|there are no|i can|if you", re.IGNORECASE)
+
+# How long facts stay fresh, by topic type (ceo/resignation topics count as news)
+STALENESS_RULES = {
+    "weather": timedelta(hours=1),
+    "stock": timedelta(hours=4),
+    "news": timedelta(days=1),
+    "personal": timedelta(days=365),  # Personal facts rarely go stale
+    "general": timedelta(days=7)
+}
+_TOPIC_KIND_RE = re.compile(r"(weather|stock|news|ceo|resignation|personal)")
+
+# Free-form queries are keyed by a hash of their normalized wording, so
+# rephrasings that differ only in case/punctuation/filler share a topic
+_NORM_RE = re.compile(r"[^a-z0-9 ]+")
+_TOPIC_STOPWORDS = frozenset(["the", "a", "an", "what", "whats", "is", "are", "of", "about", "on", "in", "to", "for"])
+
+def _normalize_query(query: str) -> str:
+    words = _NORM_RE.sub(" ", query.lower().replace("'", "")).split()
+    return " ".join(w for w in words if w not in _TOPIC_STOPWORDS)
+
+@lru_cache(maxsize=4096)
+def _free_text_topic(query: str) -> str:
+    """Stable topic id for an unclassified query; keeps the topic kind as a prefix for staleness rules."""
+    normalized = _normalize_query(query)
+    match = _TOPIC_KIND_RE.search(normalized)
+    prefix = match.group(1) if match else "q"
+    return f"{prefix}_{hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()}"
+
+# Current-weather questions, after punctuation/case normalization; the place is
+# the cache entity, so "What's the weather in Paris?" and "Tell me the weather
+# in Paris" share one reply
+_WEATHER_NOW_RE = re.compile(
+    r"^(?!.*\b(?:tomorrow|tonight|week|weekend)\b)(?:(?:whats|what is|hows|how is|tell me|show me|give me|get)\s+)?(?:the\s+)?(?:current\s+)?"
+    r"weather (?:like )?in ([a-z]+(?: [a-z]+)??)(?: (?:today|now|right now))?$"
+)
+
+class ReplyCache(TTLLRUCache):
+    """
+    Short-lived replies to current-weather questions, keyed on thread + place,
+    so a repeat of the question within `ttl` seconds (however it is worded)
+    skips analysis, web search and the LLM. Other queries are not cached.
+    """
+    
+    def __init__(self, max_size: int = 512, ttl: float = 300):
+        super().__init__(max_size, ttl)
+    
+    @staticmethod
+    def make_key(thread_id: str, query: str) -> Optional[str]:
+        """Cache key for a query on a thread, or None if its reply isn't cached."""
+        normalized = " ".join(_NORM_RE.sub(" ", query.lower().replace("'", "")).split())
+        match = _WEATHER_NOW_RE.match(normalized)
+        if not match:
+            return None
+        return hashlib.blake2b(f"{thread_id}|weather|{match.group(1)}".encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _store(self, value: Tuple[str, List[str]]) -> Tuple[str, List[str]]:
+        reply, sources = value
+        return reply, list(sources)
+
+# Shared by the /chat and /chat/stream handlers
+reply_cache = ReplyCache()
+
+# How long a ContextManagerLLM reuses the user's profile before re-reading it
+USER_CONTEXT_TTL = 60  # seconds
+
+# Longest a new turn waits for the previous turn's tracker writes to land
+TRACKING_FLUSH_TIMEOUT = 5  # seconds
+PROFILE_FACT_PREFIXES = ("Name:", "Favorite color:")
+
+# Cap on concurrent async LLM calls (per event loop) to stay within rate limits
+LLM_CONCURRENCY = 8
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    """Semaphore for the running event loop (asyncio primitives can't be shared across loops)."""
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return semaphore
+
+@lru_cache(maxsize=4)
+def _get_llm(model: str, temperature: float, api_key: Optional[str]) -> ChatOpenAI:
+    """Shared analysis LLM client; every ContextManagerLLM with the same settings reuses one."""
+    return ChatOpenAI(
+        model_name=model,
+        temperature=temperature,
+        api_key=api_key,
+        max_retries=3,
+        request_timeout=30,
+        http_client=SHARED_HTTP,
+        model_kwargs={"response_format": {"type": "json_object"}}
+    )
+
 class ContextManagerLLM:
     """
     Intelligent context manager that tracks conversations and enhances queries.
@@ -51,110 +267,99 @@ class ContextManagerLLM:
         self.session_id = session_id
         self.tracker = ConversationTracker(thread_id, session_id)
         
-        # Initialize LLM with retry logic
-        api_key = os.getenv("OPENAI_API_KEY")
-        
-        # Use gpt-3.5-turbo for better reliability
-        self.llm = ChatOpenAI(
-            model_name="gpt-3.5-turbo",
-            temperature=0,
-            api_key=api_key,
-            max_retries=3,
-            request_timeout=30
-        )
+        # Initialize LLM with retry logic (shared across instances)
+        self.llm = _get_llm(ANALYSIS_MODEL, 0, os.getenv("OPENAI_API_KEY"))
         
         # Load user preferences
         self.user_preferences = self.tracker.get_user_preferences()
         
-        # Track facts shared in current session
-        self._current_session_facts = []
+        # Track facts shared in current session (bounded; oldest drop off)
+        self._current_session_facts = deque(maxlen=MAX_SESSION_FACTS)
+        
+        # (fetched_at, user context) - the profile rarely changes between turns
+        self._user_ctx_cache: Optional[Tuple[float, Dict]] = None
+        
+        # Tracking jobs queued by track_response and not yet written
+        self._tracking_pending = 0
+        self._tracking_done = threading.Condition()
         
         # Personal query patterns
-        self._personal_patterns = {
-            "name": ["what is my name", "who am i", "my name"],
-            "color": ["what is my favorite color", "my favorite color", "my fav color", 
-                     "which color do i like", "what color do i like", "what is my fav color"],
-            "work": ["where do i work", "what company", "my company", "who do i work for"],
-            "location": ["where do i live", "where am i from", "my location"],
-            "preference": ["what do i like", "my favorite", "my preference"]
-        }
+        self._personal_patterns = PERSONAL_PATTERNS
     
     def _is_personal_fact_query(self, query: str) -> Tuple[bool, str]:
         """Detect if this is a personal fact query and return the fact type."""
-        query_lower = query.lower().strip()
-        
-        # Check each pattern
-        for fact_type, patterns in self._personal_patterns.items():
-            for pattern in patterns:
-                if pattern in query_lower:
-                    return True, fact_type
-        
-        # Check for generic personal queries
-        if any(word in query_lower for word in ["my", "i", "me"]) and \
-           any(word in query_lower for word in ["favorite", "name", "work", "live", "like"]) and \
-           "?" in query:
-            return True, "personal"
-        
-        return False, ""
+        return _classify_personal_query(query)
     
-    def analyze_query_with_context(self, query: str, memories: List[Dict]) -> QueryAnalysis:
-        """
-        Analyze query with full conversation context and temporal awareness.
-        Fixed: Better personal query detection and simpler LLM prompts.
-        """
-        # First check if this is a personal fact query
-        is_personal, personal_type = self._is_personal_fact_query(query)
+    def _user_ctx(self) -> Dict:
+        """memory_manager.get_user_context(), reused for USER_CONTEXT_TTL seconds."""
+        now = time.monotonic()
+        cached = self._user_ctx_cache
+        if cached and now - cached[0] < USER_CONTEXT_TTL:
+            return cached[1]
         
-        # Get conversation history for this topic
-        topic = self._extract_topic(query)
-        conversation_history = self.tracker.get_conversation_history(topic)
-        
-        # Get last discussion time BEFORE getting facts
-        last_discussion_time = self.tracker.get_last_discussion_time(topic)
-        
-        # Check if asking for updates
-        is_asking_for_updates = any(word in query.lower() for word in 
-                                  ["new", "update", "latest", "recent", "any more", 
-                                   "anything new", "as of now", "since"])
-        
-        # Handle personal queries differently
-        if is_personal and not is_asking_for_updates:
-            # For personal queries, we want to return the fact, not check for updates
-            user_context = memory_manager.get_user_context()
-            
-            return QueryAnalysis(
-                original_query=query,
-                enhanced_query=query,
-                query_type="personal_fact",
-                temporal_requirement="none",
-                conversation_context={
-                    "topic": personal_type,
-                    "user_context": user_context,
-                    "is_personal": True
-                },
-                search_constraints=[],
-                information_gaps=[],
-                user_intent=f"User wants to know their {personal_type}",
-                requires_search=False,
-                prompt_instructions=f"Simply state the user's {personal_type} if known",
-                exclude_facts=[],
-                is_personal_query=True
-            )
-        
-        # For non-personal queries or update queries, continue with normal analysis
-        shared_facts = self.tracker.get_shared_facts(topic)
+        user_context = memory_manager.get_user_context()
+        self._user_ctx_cache = (now, user_context)
+        return user_context
+    
+    def _invalidate_user_ctx_if_profile_changed(self, facts: List[Dict]):
+        """Drop the cached user context when a response revealed a profile fact."""
+        if any(fact["fact"].startswith(PROFILE_FACT_PREFIXES) for fact in facts):
+            self._user_ctx_cache = None
+    
+    def _wait_for_tracking(self, timeout: float = TRACKING_FLUSH_TIMEOUT):
+        """Block until this thread's queued tracker writes are applied, so the previous turn's facts are visible."""
+        with self._tracking_done:
+            if not self._tracking_done.wait_for(lambda: self._tracking_pending == 0, timeout):
+                print(f"⚠️ Tracker writes still pending after {timeout}s, reading anyway")
+    
+    def _tracking_applied(self, count: int):
+        with self._tracking_done:
+            self._tracking_pending -= count
+            self._tracking_done.notify_all()
+    
+    def _is_asking_for_updates(self, query: str) -> bool:
+        """Check if the query asks for something new since the last discussion."""
+        return any(word in query.lower() for word in 
+                   ["new", "update", "latest", "recent", "any more", 
+                    "anything new", "as of now", "since"])
+    
+    def _personal_fact_analysis(self, query: str, personal_type: str) -> QueryAnalysis:
+        """Analysis for a plain personal fact query - return the fact, don't check for updates."""
+        user_context = self._user_ctx()
         
+        return QueryAnalysis(
+            original_query=query,
+            enhanced_query=query,
+            query_type="personal_fact",
+            temporal_requirement="none",
+            conversation_context={
+                "topic": personal_type,
+                "user_context": user_context,
+                "is_personal": True
+            },
+            search_constraints=[],
+            information_gaps=[],
+            user_intent=f"User wants to know their {personal_type}",
+            requires_search=False,
+            prompt_instructions=f"Simply state the user's {personal_type} if known",
+            exclude_facts=[],
+            is_personal_query=True
+        )
+    
+    def _build_analysis_context(self, query: str, topic: str, is_personal: bool,
+                                is_asking_for_updates: bool, conversation_history,
+                                last_discussion_time: Optional[str], shared_facts: List[SharedFact],
+                                user_context: Dict, now: datetime) -> Tuple[Dict, List[SharedFact]]:
+        """Assemble the analysis context from the tracker lookups; also returns the facts to exclude."""
         # Get facts to exclude based on temporal requirements
         if is_asking_for_updates and last_discussion_time:
-            facts_to_exclude = [f for f in shared_facts if f.shared_at < last_discussion_time]
+            # Tracker keeps each topic sorted by shared_at, so this is a bisect + slice
+            facts_to_exclude = self.tracker.get_facts_before(topic, last_discussion_time)
         else:
             facts_to_exclude = shared_facts if not is_personal else []
         
-        # Get user context
-        user_context = memory_manager.get_user_context()
-        
         # Check for information staleness
-        stale_facts = self._identify_stale_facts(shared_facts, topic)
+        stale_facts = self._identify_stale_facts(topic, now=now)
         
         # Build comprehensive context for analysis
         context = {
@@ -162,17 +367,18 @@ class ContextManagerLLM:
             "topic": topic,
             "user_context": user_context,
             "conversation_history": conversation_history,
-            "shared_facts": [asdict(fact) for fact in facts_to_exclude],
+            "shared_facts": [fact.to_dict() for fact in facts_to_exclude],
             "stale_facts": stale_facts,
             "last_discussion": last_discussion_time,
             "is_asking_for_updates": is_asking_for_updates,
             "user_preferences": self.user_preferences,
             "is_personal_query": is_personal
         }
-        
-        # Use LLM to analyze the query with context
-        analysis = self._llm_analyze_query(context)
-        
+        return context, facts_to_exclude
+    
+    def _finalize_analysis(self, analysis: QueryAnalysis, is_personal: bool,
+                           is_asking_for_updates: bool, facts_to_exclude: List[SharedFact]) -> QueryAnalysis:
+        """Apply the personal-query overrides and the facts to exclude."""
         # Override LLM if we detected personal query
         if is_personal:
             analysis.is_personal_query = True
@@ -185,6 +391,76 @@ class ContextManagerLLM:
         
         return analysis
     
+    def analyze_query_with_context(self, query: str, memories: List[memory_manager.Memory],
+                                   now: Optional[datetime] = None) -> QueryAnalysis:
+        """
+        Analyze query with full conversation context and temporal awareness.
+        Fixed: Better personal query detection and simpler LLM prompts.
+        `now` is the turn's timestamp (defaults to the current UTC time).
+        """
+        # The previous turn's facts and profile updates must be written before they're read
+        self._wait_for_tracking()
+        
+        # First check if this is a personal fact query
+        is_personal, personal_type = self._is_personal_fact_query(query)
+        is_asking_for_updates = self._is_asking_for_updates(query)
+        
+        # Handle personal queries differently
+        if is_personal and not is_asking_for_updates:
+            return self._personal_fact_analysis(query, personal_type)
+        
+        # For non-personal queries or update queries, continue with normal analysis
+        topic = self._extract_topic(query)
+        conversation_history = self.tracker.get_conversation_history(topic)
+        last_discussion_time = self.tracker.get_last_discussion_time(topic)
+        shared_facts = self.tracker.get_shared_facts(topic)
+        user_context = self._user_ctx()
+        
+        context, facts_to_exclude = self._build_analysis_context(
+            query, topic, is_personal, is_asking_for_updates, conversation_history,
+            last_discussion_time, shared_facts, user_context, now or datetime.now(timezone.utc)
+        )
+        
+        # Clear-cut queries are classified by rules; only ambiguous ones go to the LLM
+        analysis, confidence = self._rule_classify(context)
+        if confidence < RULE_CONFIDENCE_THRESHOLD:
+            analysis = self._llm_analyze_query(context)
+        
+        return self._finalize_analysis(analysis, is_personal, is_asking_for_updates, facts_to_exclude)
+    
+    async def analyze_query_with_context_async(self, query: str, memories: List[memory_manager.Memory],
+                                               now: Optional[datetime] = None) -> QueryAnalysis:
+        """
+        Async analyze_query_with_context: the tracker and user-context lookups
+        run concurrently in worker threads and the LLM call uses ainvoke.
+        """
+        await asyncio.to_thread(self._wait_for_tracking)
+        
+        is_personal, personal_type = self._is_personal_fact_query(query)
+        is_asking_for_updates = self._is_asking_for_updates(query)
+        
+        if is_personal and not is_asking_for_updates:
+            return await asyncio.to_thread(self._personal_fact_analysis, query, personal_type)
+        
+        topic = self._extract_topic(query)
+        conversation_history, last_discussion_time, shared_facts, user_context = await asyncio.gather(
+            asyncio.to_thread(self.tracker.get_conversation_history, topic),
+            asyncio.to_thread(self.tracker.get_last_discussion_time, topic),
+            asyncio.to_thread(self.tracker.get_shared_facts, topic),
+            asyncio.to_thread(self._user_ctx)
+        )
+        
+        context, facts_to_exclude = self._build_analysis_context(
+            query, topic, is_personal, is_asking_for_updates, conversation_history,
+            last_discussion_time, shared_facts, user_context, now or datetime.now(timezone.utc)
+        )
+        
+        analysis, confidence = self._rule_classify(context)
+        if confidence < RULE_CONFIDENCE_THRESHOLD:
+            analysis = await self._llm_analyze_query_async(context)
+        
+        return self._finalize_analysis(analysis, is_personal, is_asking_for_updates, facts_to_exclude)
+    
     def _extract_topic(self, query: str) -> str:
         """Extract the main topic from a query."""
         # For personal queries, use specific topics
@@ -208,66 +484,27 @@ class ContextManagerLLM:
         elif "stock" in query_lower:
             return "stock_price"
         else:
-            # Use first 50 chars as topic
-            return query[:50].strip()
+            return _free_text_topic(query)
     
-    def _identify_stale_facts(self, facts: List[SharedFact], topic: str) -> List[SharedFact]:
+    def _identify_stale_facts(self, topic: str, now: Optional[datetime] = None) -> List[SharedFact]:
         """Identify facts that may need updating based on topic type."""
-        stale_facts = []
-        now = datetime.now(timezone.utc)
-        
-        # Define staleness by topic type
-        staleness_rules = {
-            "weather": timedelta(hours=1),
-            "stock": timedelta(hours=4),
-            "news": timedelta(days=1),
-            "personal": timedelta(days=365),  # Personal facts rarely go stale
-            "general": timedelta(days=7)
-        }
+        now = now or datetime.now(timezone.utc)
         
         # Determine topic type
-        topic_type = "general"
-        for key in ["weather", "stock", "news", "ceo", "resignation", "personal"]:
-            if key in topic.lower():
-                topic_type = "news" if key in ["ceo", "resignation"] else key
-                break
-        
-        max_age = staleness_rules.get(topic_type, timedelta(days=7))
+        match = _TOPIC_KIND_RE.search(topic.lower())
+        topic_type = match.group(1) if match else "general"
+        if topic_type in NEWS_KEYWORDS:
+            topic_type = "news"
         
-        for fact in facts:
-            fact_age = now - datetime.fromisoformat(fact.timestamp)
-            if fact_age > max_age:
-                stale_facts.append(fact)
+        max_age = STALENESS_RULES[topic_type]
         
-        return stale_facts
+        # The tracker scans its flat per-topic timestamp column (the shared facts
+        # for this topic were loaded into it by get_shared_facts)
+        return self.tracker.get_facts_older_than(topic, (now - max_age).timestamp())
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    def _llm_analyze_query(self, context: Dict) -> QueryAnalysis:
-        """Use LLM to perform deep query analysis with context. Now with retries and simpler prompt."""
-        
-        # Simplified, more reliable prompt
-        system_prompt = """Analyze the user query and provide a JSON response.
-
-Return EXACTLY this JSON structure:
-{
-    "enhanced_query": "the query enhanced with any user context",
-    "query_type": "personal_fact|news|weather|stock|temporal_update|general",
-    "temporal_requirement": "immediate|recent|update_since_last|none",
-    "search_constraints": [],
-    "information_gaps": [],
-    "user_intent": "what the user wants to know",
-    "requires_search": true/false,
-    "prompt_instructions": "instructions for the assistant"
-}
-
-Rules:
-- If query is about user's personal info (name, favorite color, etc), set query_type="personal_fact" and requires_search=false
-- If query contains "new", "update", "latest", "recent", set temporal_requirement="update_since_last"
-- Only set requires_search=true if web search is needed
-- Keep responses simple and direct"""
-
-        # Build simpler user prompt
-        user_prompt = f"""Query: {context['user_query']}
+    def _analysis_user_prompt(self, context: Dict) -> str:
+        """Build simpler user prompt"""
+        return f"""Query: {context['user_query']}
 
 User Info:
 - Name: {context['user_context'].get('name', 'Unknown')}
@@ -276,77 +513,124 @@ User Info:
 Is asking for updates: {context['is_asking_for_updates']}
 Is personal query: {context.get('is_personal_query', False)}
 Last discussed: {context['last_discussion'] or 'Never'}"""
+    
+    @staticmethod
+    def _parse_analysis_json(content: str) -> Dict:
+        """Parse JSON with better error handling"""
+        content = content.strip()
+        if not content:
+            raise ValueError("Empty response from LLM")
+        
+        # JSON mode normally guarantees a bare object; only dig it out of extra text if not
+        try:
+            return _json_loads(content)
+        except ValueError:
+            json_match = _JSON_EXTRACT_RE.search(content)
+            if not json_match:
+                raise
+            return _json_loads(json_match.group())
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    def _llm_analyze_query(self, context: Dict) -> QueryAnalysis:
+        """Use LLM to perform deep query analysis with context. Now with retries and simpler prompt."""
+        
+        # Repeated queries in the same user context reuse the earlier analysis
+        user_prompt = self._analysis_user_prompt(context)
+        cache_key = analysis_cache.make_key(user_prompt)
+        result = analysis_cache.get(cache_key)
+        if result is not None:
+            return self._analysis_from_result(context, result)
 
         try:
             response = self.llm.invoke([
-                SystemMessage(content=system_prompt),
+                SystemMessage(content=ANALYSIS_SYSTEM_PROMPT),
                 HumanMessage(content=user_prompt)
             ])
             
-            # Parse JSON with better error handling
-            content = response.content.strip()
-            if not content:
-                raise ValueError("Empty response from LLM")
+            result = self._parse_analysis_json(response.content)
+            analysis_cache.set(cache_key, result)
             
-            # Try to extract JSON even if there's extra text
-            import re
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
-            if json_match:
-                content = json_match.group()
+            return self._analysis_from_result(context, result)
             
-            result = json.loads(content)
+        except Exception as e:
+            print(f"⚠️ LLM analysis error (will use fallback): {e}")
+            return self._fallback_analysis(context)
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def _llm_analyze_query_async(self, context: Dict) -> QueryAnalysis:
+        """Async _llm_analyze_query; concurrent calls are capped by the LLM semaphore."""
+        user_prompt = self._analysis_user_prompt(context)
+        cache_key = analysis_cache.make_key(user_prompt)
+        result = analysis_cache.get(cache_key)
+        if result is not None:
+            return self._analysis_from_result(context, result)
+        
+        try:
+            async with _llm_semaphore():
+                response = await self.llm.ainvoke([
+                    SystemMessage(content=ANALYSIS_SYSTEM_PROMPT),
+                    HumanMessage(content=user_prompt)
+                ])
             
-            # Validate and set defaults
-            return QueryAnalysis(
-                original_query=context["user_query"],
-                enhanced_query=result.get("enhanced_query", context["user_query"]),
-                query_type=result.get("query_type", "general"),
-                temporal_requirement=result.get("temporal_requirement", "none"),
-                conversation_context=context,
-                search_constraints=result.get("search_constraints", []),
-                information_gaps=result.get("information_gaps", []),
-                user_intent=result.get("user_intent", "General information request"),
-                requires_search=result.get("requires_search", False),
-                prompt_instructions=result.get("prompt_instructions", ""),
-                exclude_facts=[],
-                is_personal_query=context.get('is_personal_query', False)
-            )
+            result = self._parse_analysis_json(response.content)
+            analysis_cache.set(cache_key, result)
+            
+            return self._analysis_from_result(context, result)
             
         except Exception as e:
             print(f"⚠️ LLM analysis error (will use fallback): {e}")
             return self._fallback_analysis(context)
     
+    def _analysis_from_result(self, context: Dict, result: Dict) -> QueryAnalysis:
+        """Build a QueryAnalysis from the model's JSON, with defaults for missing keys."""
+        return QueryAnalysis(
+            original_query=context["user_query"],
+            enhanced_query=result.get("enhanced_query", context["user_query"]),
+            query_type=result.get("query_type", "general"),
+            temporal_requirement=result.get("temporal_requirement", "none"),
+            conversation_context=context,
+            search_constraints=list(result.get("search_constraints", [])),
+            information_gaps=list(result.get("information_gaps", [])),
+            user_intent=result.get("user_intent", "General information request"),
+            requires_search=result.get("requires_search", False),
+            prompt_instructions=result.get("prompt_instructions", ""),
+            exclude_facts=[],
+            is_personal_query=context.get('is_personal_query', False)
+        )
+    
     def _fallback_analysis(self, context: Dict) -> QueryAnalysis:
         """Enhanced fallback analysis when LLM fails."""
+        return self._rule_classify(context)[0]
+    
+    def _rule_classify(self, context: Dict) -> Tuple[QueryAnalysis, float]:
+        """
+        Keyword/pattern-based analysis and a confidence score. Personal-fact
+        patterns and weather/stock/news keywords are confident matches;
+        anything else scores 0 and should be analyzed by the LLM.
+        """
         query = context["user_query"]
-        query_lower = query.lower()
         
         # Check if personal query
         is_personal, personal_type = self._is_personal_fact_query(query)
         
         # Default values
         enhanced_query = query
-        query_type = "general"
         requires_search = True
         search_constraints = []
         prompt_instructions = ""
+        query_type, confidence = _classify_keywords(query.lower())
         
         # Personal query handling
         if is_personal:
             query_type = "personal_fact"
+            confidence = 0.9
             requires_search = False
             prompt_instructions = f"State the user's {personal_type} if known"
         # News/updates query
-        elif any(word in query_lower for word in ["ceo", "resignation", "news"]):
-            query_type = "news"
+        elif query_type == "news":
             if context["user_context"].get("company"):
-                enhanced_query = query.replace("our", context["user_context"]["company"])
-        # Weather query
-        elif "weather" in query_lower:
-            query_type = "weather"
-        # Stock query
-        elif "stock" in query_lower:
-            query_type = "stock"
+                company = context["user_context"]["company"]
+                enhanced_query = _OUR_RE.sub(lambda _: company, query)
         
         # Temporal handling
         temporal_requirement = "none"
@@ -357,24 +641,25 @@ Last discussed: {context['last_discussion'] or 'Never'}"""
                 search_constraints.append(f"after:{after_date}")
                 prompt_instructions = "Only provide information newer than the last discussion"
         
-        return QueryAnalysis(
+        analysis = QueryAnalysis(
             original_query=query,
             enhanced_query=enhanced_query,
             query_type=query_type,
             temporal_requirement=temporal_requirement,
             conversation_context=context,
             search_constraints=search_constraints,
-            information_gaps=["Unable to determine specific gaps"],
+            information_gaps=[] if confidence else ["Unable to determine specific gaps"],
             user_intent=f"User wants to know about {query_type}",
             requires_search=requires_search and not is_personal,
             prompt_instructions=prompt_instructions,
             exclude_facts=[f['fact'] for f in context.get("shared_facts", [])],
             is_personal_query=is_personal
         )
+        return analysis, confidence
     
     def generate_dynamic_prompt(self, 
                               query_analysis: QueryAnalysis,
-                              retrieved_memories: List[Dict],
+                              retrieved_memories: List[memory_manager.Memory],
                               web_results: Optional[List] = None) -> str:
         """
         Generate a dynamic prompt based on conversation context.
@@ -429,14 +714,8 @@ Last discussed: {context['last_discussion'] or 'Never'}"""
         
         return full_prompt
     
-    def track_response(self, query: str, response: str, sources: List[str] = None):
-        """
-        Track what information was shared in the response.
-        Enhanced with better fact extraction.
-        """
-        topic = self._extract_topic(query)
-        
-        # Don't track facts for certain responses
+    def _should_track_response(self, response: str) -> bool:
+        """Don't track facts for certain responses"""
         no_track_phrases = [
             "I don't have any new updates",
             "There are no new updates",
@@ -444,102 +723,115 @@ Last discussed: {context['last_discussion'] or 'Never'}"""
             "I don't have that information"
         ]
         
-        should_track = not any(phrase in response for phrase in no_track_phrases)
+        return not any(phrase in response for phrase in no_track_phrases)
+    
+    def track_response(self, query: str, response: str, sources: List[str] = None,
+                       now: Optional[datetime] = None):
+        """
+        Track what information was shared in the response.
+        Enhanced with better fact extraction. Facts are extracted here; the
+        tracker writes are queued for the background writer, so this returns
+        without waiting on Azure Search.
+        """
+        topic = self._extract_topic(query)
         
-        fact_ids = []
-        if should_track:
+        facts = []
+        if self._should_track_response(response):
             # Extract facts from response
             facts = self._extract_facts_from_response(response, topic)
-            
-            # Store each fact
-            for fact in facts:
-                fact_id = self.tracker.add_shared_fact(
-                    topic=topic,
-                    fact=fact["fact"],
-                    source=fact.get("source", "conversation"),
-                    confidence=fact.get("confidence", 0.8)
-                )
-                if fact_id:
-                    fact_ids.append(fact_id)
-                    self._current_session_facts.append(fact["fact"])
+            self._invalidate_user_ctx_if_profile_changed(facts)
         
-        # Always store conversation turn
-        self.tracker.add_conversation_turn(
+        # Always store conversation turn, together with preference updates
+        job = TrackingJob(
             topic=topic,
             query=query,
             response=response,
             sources=sources or [],
-            fact_ids=fact_ids
+            facts=[
+                (topic, fact["fact"], fact.get("source", "conversation"), fact.get("confidence", 0.8))
+                for fact in facts
+            ],
+            prefs=self._preference_updates(query, response, now=now)
         )
-        
-        # Update user preferences based on interaction
-        self._update_user_preferences(query, response)
+        with self._tracking_done:
+            self._tracking_pending += 1
+        _tracking_queue.put((self, job))
+    
+    async def track_response_async(self, query: str, response: str, sources: List[str] = None,
+                                   now: Optional[datetime] = None):
+        """Async track_response; queuing the writes never blocks, so this just delegates."""
+        self.track_response(query, response, sources, now=now)
+    
+    def _apply_tracking_jobs(self, jobs: List[TrackingJob]):
+        """Write queued jobs through the tracker (runs on the background writer thread)."""
+        for job, fact_ids in zip(jobs, self.tracker.bulk_apply(jobs)):
+            for (_, fact, _, _), fact_id in zip(job.facts, fact_ids):
+                if fact_id:
+                    self._current_session_facts.append(fact)
     
     def _extract_facts_from_response(self, response: str, topic: str) -> List[Dict]:
         """Extract individual facts from a response - simplified version."""
         facts = []
         
         # Don't extract from negative responses
-        if any(phrase in response.lower() for phrase in ["don't have", "no new", "not available"]):
+        if _NEGATIVE_RESPONSE_RE.search(response):
             return facts
         
         # Simple extraction for personal facts
         if "personal_" in topic:
             # Extract statements about user
-            if "name is" in response.lower():
-                import re
-                match = re.search(r"name is (\w+)", response, re.IGNORECASE)
-                if match:
-                    facts.append({
-                        "fact": f"Name: {match.group(1)}",
-                        "confidence": 0.9,
-                        "source": "user"
-                    })
-            if "favorite color" in response.lower() and "is" in response.lower():
-                match = re.search(r"favorite color is (\w+)", response, re.IGNORECASE)
-                if match:
-                    facts.append({
-                        "fact": f"Favorite color: {match.group(1)}",
-                        "confidence": 0.9,
-                        "source": "user"
-                    })
+            match = _NAME_RE.search(response)
+            if match:
+                facts.append({
+                    "fact": f"Name: {match.group(1)}",
+                    "confidence": 0.9,
+                    "source": "user"
+                })
+            match = _COLOR_RE.search(response)
+            if match:
+                facts.append({
+                    "fact": f"Favorite color: {match.group(1)}",
+                    "confidence": 0.9,
+                    "source": "user"
+                })
         else:
             # For other topics, extract key sentences
-            sentences = response.split('.')
-            for sentence in sentences:
-                sentence = sentence.strip()
-                # Look for factual statements
-                if len(sentence) > 20 and any(indicator in sentence.lower() for indicator in 
-                                             ['is', 'are', 'was', 'were', 'will', 'has', 'have']):
-                    # Skip meta-statements
-                    if not any(skip in sentence.lower() for skip in 
-                             ["i don't", "there are no", "i can", "if you"]):
-                        facts.append({
-                            "fact": sentence + ".",
-                            "confidence": 0.7,
-                            "source": "conversation"
-                        })
-        
-        return facts[:5]  # Limit to 5 facts per response
-    
-    def _update_user_preferences(self, query: str, response: str):
-        """Learn from user interactions to improve future responses."""
+            for match in _SENTENCE_RE.finditer(response):
+                sentence = match.group().strip()
+                # Look for factual statements, skipping meta-statements
+                if len(sentence) > 20 and _FACT_INDICATOR_RE.search(sentence) and not _META_STATEMENT_RE.search(sentence):
+                    facts.append({
+                        "fact": sentence + ".",
+                        "confidence": 0.7,
+                        "source": "conversation"
+                    })
+                    if len(facts) == MAX_FACTS_PER_RESPONSE:
+                        break
+        
+        return facts[:MAX_FACTS_PER_RESPONSE]
+    
+    def _preference_updates(self, query: str, response: str,
+                            now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Learn from user interactions to improve future responses; returns the preferences to write."""
+        now = now or datetime.now(timezone.utc)
         # Track query patterns
-        self.tracker.update_preference("query_patterns", {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "query_type": self._extract_topic(query),
-            "query_length": len(query),
-            "response_length": len(response)
-        })
+        prefs = {
+            "query_patterns": {
+                "timestamp": now.isoformat(),
+                "query_type": self._extract_topic(query),
+                "query_length": len(query),
+                "response_length": len(response)
+            }
+        }
         
         # Detect preferences from query
         if "brief" in query.lower() or "summary" in query.lower():
-            self.tracker.update_preference("response_style", "concise")
+            prefs["response_style"] = "concise"
         elif "detail" in query.lower() or "explain" in query.lower():
-            self.tracker.update_preference("response_style", "detailed")
+            prefs["response_style"] = "detailed"
         
-        # Track interaction frequency
-        self.tracker.increment_interaction_count()
+        # Interaction frequency is counted when the job is applied (ConversationTracker.bulk_apply)
+        return prefs
     
     def get_conversation_summary(self, topic: Optional[str] = None) -> str:
         """Get a summary of conversations on a topic."""
@@ -563,14 +855,14 @@ Last discussed: {context['last_discussion'] or 'Never'}"""
             all_topics = self.tracker.get_all_topics()
             return f"**Overall Conversation Summary:**\n- Topics discussed: {len(all_topics)}\n- Total interactions: {self.tracker.get_interaction_count()}"
     
-    def should_proactively_update(self, topic: str) -> Tuple[bool, str]:
+    def should_proactively_update(self, topic: str, now: Optional[datetime] = None) -> Tuple[bool, str]:
         """Determine if we should proactively offer updates on a topic."""
         last_discussion = self.tracker.get_last_discussion_time(topic)
         if not last_discussion:
             return False, ""
         
         # Check time since last discussion
-        time_since = datetime.now(timezone.utc) - datetime.fromisoformat(last_discussion)
+        time_since = (now or datetime.now(timezone.utc)) - datetime.fromisoformat(last_discussion)
         
         # Rules for proactive updates
         if "stock" in topic.lower() and time_since > timedelta(hours=4):
@@ -578,4 +870,74 @@ Last discussed: {context['last_discussion'] or 'Never'}"""
         elif ("news" in topic.lower() or "ceo" in topic.lower()) and time_since > timedelta(days=1):
             return True, f"There may be new developments on {topic} since we last talked."
         
-        return False, ""
\ No newline at end of file
+        return False, ""
+
+# ─── Per-thread instance cache ──────────────────────────────────
+# Building a ContextManagerLLM reloads the tracker's history from Azure Search,
+# so instances are reused per thread_id (LRU, bounded)
+MAX_CACHED_CONTEXT_MANAGERS = 128
+
+_cm_cache: "OrderedDict[str, ContextManagerLLM]" = OrderedDict()
+_cm_lock = threading.Lock()
+
+def get_context_manager(thread_id: str, session_id: Optional[str] = None) -> ContextManagerLLM:
+    """Return the cached ContextManagerLLM for a thread, creating it on first use."""
+    with _cm_lock:
+        if thread_id in _cm_cache:
+            _cm_cache.move_to_end(thread_id)
+            return _cm_cache[thread_id]
+    
+    # Construct outside the lock; it does network I/O
+    context_manager = ContextManagerLLM(thread_id, session_id)
+    
+    with _cm_lock:
+        # Another request may have built one meanwhile - keep the first
+        context_manager = _cm_cache.setdefault(thread_id, context_manager)
+        _cm_cache.move_to_end(thread_id)
+        if len(_cm_cache) > MAX_CACHED_CONTEXT_MANAGERS:
+            _cm_cache.popitem(last=False)
+    
+    return context_manager
+
+# ─── Background tracker writer ──────────────────────────────────
+# track_response queues (context manager, TrackingJob) pairs; one daemon thread
+# drains whatever has accumulated and applies it per tracker in bulk
+_tracking_queue: "queue.Queue[Tuple[ContextManagerLLM, TrackingJob]]" = queue.Queue()
+
+def _apply_tracking_batch(batch: List[Tuple[ContextManagerLLM, TrackingJob]]):
+    """Group queued jobs by context manager (keeping their order) and apply each group."""
+    grouped: Dict[int, Tuple[ContextManagerLLM, List[TrackingJob]]] = {}
+    for context_manager, job in batch:
+        grouped.setdefault(id(context_manager), (context_manager, []))[1].append(job)
+    
+    for context_manager, jobs in grouped.values():
+        try:
+            context_manager._apply_tracking_jobs(jobs)
+        except Exception as e:
+            print(f"❌ Error writing {len(jobs)} tracking jobs: {e}")
+        finally:
+            context_manager._tracking_applied(len(jobs))
+
+def _tracking_writer_loop():
+    while True:
+        batch = [_tracking_queue.get()]
+        try:
+            while True:
+                batch.append(_tracking_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        try:
+            _apply_tracking_batch(batch)
+        finally:
+            for _ in batch:
+                _tracking_queue.task_done()
+
+def flush_tracking_writes():
+    """Block until every queued tracker write has been applied."""
+    _tracking_queue.join()
+
+threading.Thread(target=_tracking_writer_loop, name="tracker-writer", daemon=True).start()
+
+# Drain pending tracker writes when the process exits
+atexit.register(flush_tracking_writes)
@@ -9,21 +9,39 @@ import json
 import uuid
 import base64
 import time
+import bisect
+import threading
+from array import array
+import numpy as np
 from datetime import datetime, timezone
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 import hashlib
 
 from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
+from azure.search.documents import SearchClient, IndexDocumentsBatch
 from azure.search.documents.models import VectorizedQuery
 from dotenv import load_dotenv
 
+import memory_manager
+from vector_ops import EMBEDDING_DIM, normalize_rows
+
 load_dotenv()
 
+# Azure read queries (history, topics, last-discussion lookups that miss the
+# caches) are reused for this many seconds; any tracked write clears them
+QUERY_CACHE_TTL = 5.0
+
+# Bulk-tracked facts closer than this (cosine) to a known one reuse its ID
+FACT_DEDUP_SIMILARITY = 0.92
+
 @dataclass
 class SharedFact:
     """Represents a fact shared with the user"""
+    __slots__ = ("id", "topic", "fact", "fact_hash", "source", "timestamp",
+                 "shared_at", "confidence", "thread_id", "embedding_text",
+                 "_ts")  # parsed timestamp, filled lazily by .parsed_timestamp
+    
     id: str
     topic: str
     fact: str
@@ -34,6 +52,46 @@ class SharedFact:
     confidence: float
     thread_id: str
     embedding_text: str  # For semantic similarity
+    
+    @property
+    def parsed_timestamp(self) -> datetime:
+        """timestamp as a datetime, parsed on first access and kept (facts are immutable)."""
+        try:
+            return self._ts
+        except AttributeError:
+            # Facts loaded at startup only select shared_at, which is set alongside timestamp
+            self._ts = datetime.fromisoformat(self.timestamp or self.shared_at)
+            return self._ts
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict of the fields the analysis prompt uses (no dataclasses.asdict deepcopy)."""
+        return {
+            "topic": self.topic,
+            "fact": self.fact,
+            "source": self.source,
+            "confidence": self.confidence,
+            "shared_at": self.shared_at,
+            "timestamp": self.timestamp
+        }
+
+class TopicFacts:
+    """
+    One topic's cached facts as parallel columns, sorted by shared_at.
+    Filters run over the flat columns (bisect on shared_at, scans over
+    epoch seconds) instead of reading attributes off each SharedFact.
+    """
+    __slots__ = ("shared_at", "epoch", "facts")
+    
+    def __init__(self):
+        self.shared_at: List[str] = []   # ISO strings, sort key
+        self.epoch = array("d")          # parsed timestamp, seconds since epoch
+        self.facts: List[SharedFact] = []
+    
+    def insert(self, fact: SharedFact):
+        i = bisect.bisect_right(self.shared_at, fact.shared_at)
+        self.shared_at.insert(i, fact.shared_at)
+        self.epoch.insert(i, fact.parsed_timestamp.timestamp())
+        self.facts.insert(i, fact)
 
 @dataclass
 class ConversationTurn:
@@ -47,6 +105,16 @@ class ConversationTurn:
     thread_id: str
     facts_shared: List[str]  # Track which facts were shared in this turn
 
+@dataclass
+class TrackingJob:
+    """One response's worth of tracker writes, applied later in a batch"""
+    topic: str
+    query: str
+    response: str
+    sources: List[str]
+    facts: List[Tuple[str, str, str, float]]  # (topic, fact, source, confidence)
+    prefs: Dict[str, Any]
+
 class ConversationTracker:
     """
     Tracks conversation history and shared information with temporal awareness.
@@ -58,6 +126,12 @@ class ConversationTracker:
         self.thread_id = self._encode_key(thread_id)
         self.raw_thread_id = thread_id
         self.session_id = session_id or self.thread_id
+        self._cache_lock = threading.Lock()  # fact caches are written by the tracking writer thread
+        self._query_cache: Dict[Tuple, Tuple[float, Any]] = {}  # key -> (expires_at, result)
+        # topic -> (fact ids, unit vectors) for bulk dedup; embedded once per topic
+        self._topic_fact_vecs: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        # Writes buffered inside `with tracker:`, per thread so the tracking writer never sees them
+        self._local = threading.local()
         
         # Initialize Azure Search client
         self.endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
@@ -80,6 +154,7 @@ class ConversationTracker:
             self.search_client = None
             # Initialize empty caches if Azure Search fails
             self._fact_cache = {}
+            self._topic_facts = {}
             self._preference_cache = {}
             self._last_discussion_times = {}
             self._topics_cache = set()
@@ -90,6 +165,7 @@ class ConversationTracker:
         
         # Initialize caches
         self._fact_cache = {}
+        self._topic_facts: Dict[str, TopicFacts] = {}
         self._preference_cache = {}
         self._last_discussion_times = {}
         self._topics_cache = set()
@@ -130,7 +206,7 @@ class ConversationTracker:
             fact_count = 0
             for result in fact_results:
                 fact_hash = result["fact_hash"]
-                self._fact_cache[fact_hash] = SharedFact(
+                self._cache_fact(SharedFact(
                     id=result.get("id", ""),
                     topic=result["topic"],
                     fact=result["fact"],
@@ -141,7 +217,7 @@ class ConversationTracker:
                     confidence=result.get("confidence", 0.8),
                     thread_id=self.thread_id,
                     embedding_text=result.get("embedding_text", result["fact"])
-                )
+                ))
                 fact_count += 1
             
             print(f"   📚 Loaded {fact_count} shared facts into cache")
@@ -164,6 +240,127 @@ class ConversationTracker:
         except Exception as e:
             print(f"❌ Error loading historical data: {e}")
     
+    def _cache_fact(self, fact: SharedFact):
+        """Add a fact to the hash cache and insertion-sort it into its topic's columns."""
+        with self._cache_lock:
+            if fact.fact_hash in self._fact_cache:
+                return
+            self._fact_cache[fact.fact_hash] = fact
+            if fact.topic not in self._topic_facts:
+                self._topic_facts[fact.topic] = TopicFacts()
+            self._topic_facts[fact.topic].insert(fact)
+    
+    def get_facts_before(self, topic: str, timestamp: str) -> List[SharedFact]:
+        """Cached facts on a topic shared strictly before timestamp, oldest first."""
+        with self._cache_lock:
+            columns = self._topic_facts.get(topic)
+            if columns is None:
+                return []
+            return columns.facts[:bisect.bisect_left(columns.shared_at, timestamp)]
+    
+    def get_facts_older_than(self, topic: str, cutoff: float) -> List[SharedFact]:
+        """Cached facts on a topic whose timestamp is before cutoff (epoch seconds), newest first."""
+        with self._cache_lock:
+            columns = self._topic_facts.get(topic)
+            if columns is None or not columns.epoch:
+                return []
+            # Vectorized compare over a copy of the epoch column: a zero-copy view
+            # would export the array's buffer, and inserts raise BufferError while it lives
+            epochs = np.array(columns.epoch, dtype=np.float64)
+            stale = np.flatnonzero(epochs < cutoff)
+            return [columns.facts[i] for i in stale[::-1]]
+    
+    def _cached_query(self, key: Tuple, load):
+        """Result of load() for key, reused for QUERY_CACHE_TTL seconds."""
+        now = time.monotonic()
+        with self._cache_lock:
+            hit = self._query_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+        
+        value = load()
+        with self._cache_lock:
+            self._query_cache[key] = (now + QUERY_CACHE_TTL, value)
+        return value
+    
+    def _invalidate_queries(self):
+        """Drop cached query results after a write to this thread."""
+        with self._cache_lock:
+            self._query_cache.clear()
+    
+    def __enter__(self):
+        """Buffer this thread's add_shared_fact / add_conversation_turn / update_preference writes until exit."""
+        self._local.pending = []
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        pending, self._local.pending = self._local.pending, None
+        self.flush(pending)
+        return False
+    
+    def _buffer(self, action: str, doc: Dict, on_success) -> bool:
+        """
+        Queue doc for the flush when this thread is buffering; on_success
+        updates the caches once the write is indexed. False means write it now.
+        """
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            return False
+        pending.append((action, doc, on_success))
+        return True
+    
+    def _queued_fact_id(self, fact_hash: str) -> Optional[str]:
+        """ID of a fact with this hash already waiting in this thread's buffer."""
+        for _, doc, _ in getattr(self._local, "pending", None) or []:
+            if doc.get("fact_hash") == fact_hash:
+                return doc["id"]
+        return None
+    
+    def flush(self, pending: List[Tuple[str, Dict, Any]]):
+        """Send buffered (action, doc, on_success) writes to Azure Search as one indexing request."""
+        if not pending or not self.search_client:
+            return
+        
+        batch = IndexDocumentsBatch()
+        for action, doc, _ in pending:
+            if action == "merge_or_upload":
+                batch.add_merge_or_upload_actions([doc])
+            else:
+                batch.add_upload_actions([doc])
+        
+        try:
+            results = self.search_client.index_documents(batch)
+            # Only writes that were indexed reach the caches
+            for (_, _, on_success), result in zip(pending, results):
+                if result.succeeded:
+                    on_success()
+            failed = [r for r in results if not r.succeeded]
+            if failed:
+                print(f"❌ Failed to track {len(failed)} of {len(pending)} buffered writes: {failed[0].error_message}")
+            else:
+                print(f"✅ Flushed {len(pending)} tracked writes")
+            
+            # Force a small delay to ensure indexing
+            time.sleep(0.5)
+        except Exception as e:
+            print(f"❌ Error flushing tracked writes: {e}")
+    
+    def _fact_indexed(self, shared_fact: SharedFact):
+        """Update caches after a fact was written to the index."""
+        self._cache_fact(shared_fact)
+        with self._cache_lock:
+            # No vector for this fact here; the topic is re-embedded on its next bulk dedup
+            self._topic_fact_vecs.pop(shared_fact.topic, None)
+        self._last_discussion_times[shared_fact.topic] = datetime.now(timezone.utc).isoformat()
+        self._topics_cache.add(shared_fact.topic)
+        self._invalidate_queries()
+    
+    def _turn_indexed(self, topic: str, timestamp: str):
+        """Update caches after a conversation turn was written to the index."""
+        self._last_discussion_times[topic] = timestamp
+        self._topics_cache.add(topic)
+        self._invalidate_queries()
+    
     def _encode_key(self, key: str) -> str:
         """Encode keys to be Azure Search compliant (alphanumeric, _, -, =)"""
         # Replace dots and other special characters
@@ -185,6 +382,9 @@ class ConversationTracker:
         if fact_hash in self._fact_cache:
             print(f"📝 Fact already in cache: {fact[:50]}...")
             return self._fact_cache[fact_hash].id
+        queued_id = self._queued_fact_id(fact_hash)
+        if queued_id:
+            return queued_id
         
         # Check if similar fact already exists in Azure
         similar_facts = self._find_similar_facts(fact)
@@ -214,13 +414,13 @@ class ConversationTracker:
                 "session_id": self.session_id
             }
             
+            if self._buffer("upload", doc, lambda: self._fact_indexed(shared_fact)):
+                return fact_id
+            
             result = self.search_client.upload_documents(documents=[doc])
             if result[0].succeeded:
                 print(f"✅ Tracked fact: {fact[:50]}...")
-                # Update caches
-                self._fact_cache[fact_hash] = shared_fact
-                self._last_discussion_times[topic] = datetime.now(timezone.utc).isoformat()
-                self._topics_cache.add(topic)
+                self._fact_indexed(shared_fact)
                 
                 # Force a small delay to ensure indexing
                 time.sleep(0.5)
@@ -231,6 +431,142 @@ class ConversationTracker:
         
         return None
     
+    def add_shared_facts_bulk(self, facts: List[Tuple[str, str, str, float]]) -> List[Optional[str]]:
+        """
+        Add several shared facts with one upload request.
+        Each item is (topic, fact, source, confidence); returns a fact ID (or None) per item.
+        """
+        if not self.search_client or not facts:
+            return [None] * len(facts)
+        
+        fact_ids: List[Optional[str]] = [None] * len(facts)
+        new_facts: List[SharedFact] = []
+        batch_hashes = {}
+        now = datetime.now(timezone.utc).isoformat()
+        
+        # Exact repeats are settled from the cache (and this batch) first
+        candidates = []
+        for i, (topic, fact, source, confidence) in enumerate(facts):
+            fact_hash = hashlib.md5(fact.lower().strip().encode()).hexdigest()
+            if fact_hash in self._fact_cache:
+                print(f"📝 Fact already in cache: {fact[:50]}...")
+                fact_ids[i] = self._fact_cache[fact_hash].id
+            elif fact_hash not in batch_hashes:
+                batch_hashes[fact_hash] = i
+                candidates.append((i, fact_hash))
+        if not candidates:
+            return fact_ids
+        
+        # Near-duplicates: one embedding call for the new facts, compared locally
+        # against each topic's cached fact vectors and earlier facts in the batch
+        new_vecs = normalize_rows(memory_manager.get_embeddings([facts[i][1] for i, _ in candidates]))
+        known = {topic: self._topic_fact_vectors(topic) for topic in {facts[i][0] for i, _ in candidates}}
+        
+        kept_rows, kept_ids = [], []
+        for row, (i, fact_hash) in enumerate(candidates):
+            topic, fact, source, confidence = facts[i]
+            known_ids, known_vecs = known[topic]
+            if known_ids:
+                sims = known_vecs @ new_vecs[row]
+                best = int(sims.argmax())
+                if sims[best] > FACT_DEDUP_SIMILARITY:
+                    print(f"📝 Similar fact already tracked: {fact[:50]}...")
+                    fact_ids[i] = known_ids[best]
+                    continue
+            if kept_rows:
+                sims = new_vecs[kept_rows] @ new_vecs[row]
+                best = int(sims.argmax())
+                if sims[best] > FACT_DEDUP_SIMILARITY:
+                    fact_ids[i] = kept_ids[best]
+                    continue
+            
+            shared_fact = SharedFact(
+                id=str(uuid.uuid4()),
+                topic=topic,
+                fact=fact,
+                fact_hash=fact_hash,
+                source=source,
+                timestamp=now,
+                shared_at=now,
+                confidence=confidence,
+                thread_id=self.thread_id,
+                embedding_text=fact
+            )
+            new_facts.append(shared_fact)
+            kept_rows.append(row)
+            kept_ids.append(shared_fact.id)
+            fact_ids[i] = shared_fact.id
+        
+        # Exact in-batch repeats point at the first occurrence's ID
+        for i, (topic, fact, source, confidence) in enumerate(facts):
+            if fact_ids[i] is None:
+                fact_ids[i] = fact_ids[batch_hashes[hashlib.md5(fact.lower().strip().encode()).hexdigest()]]
+        
+        if not new_facts:
+            return fact_ids
+        
+        stored = set()
+        try:
+            docs = [
+                {**asdict(shared_fact), "recordType": "shared_fact", "session_id": self.session_id}
+                for shared_fact in new_facts
+            ]
+            results = self.search_client.upload_documents(documents=docs)
+            stored_rows: Dict[str, List[Tuple[str, int]]] = {}  # topic -> (id, row in new_vecs)
+            for shared_fact, row, result in zip(new_facts, kept_rows, results):
+                if result.succeeded:
+                    print(f"✅ Tracked fact: {shared_fact.fact[:50]}...")
+                    stored.add(shared_fact.id)
+                    # Update caches
+                    self._cache_fact(shared_fact)
+                    stored_rows.setdefault(shared_fact.topic, []).append((shared_fact.id, row))
+                    self._last_discussion_times[shared_fact.topic] = now
+                    self._topics_cache.add(shared_fact.topic)
+            for topic, rows in stored_rows.items():
+                self._remember_fact_vectors(topic, [fid for fid, _ in rows], new_vecs[[row for _, row in rows]])
+            if stored:
+                self._invalidate_queries()
+            
+            # Force a small delay to ensure indexing (once for the whole batch)
+            time.sleep(0.5)
+        except Exception as e:
+            print(f"❌ Error tracking {len(new_facts)} facts: {e}")
+        
+        new_ids = {shared_fact.id for shared_fact in new_facts}
+        return [fid if fid not in new_ids or fid in stored else None for fid in fact_ids]
+    
+    def _topic_fact_vectors(self, topic: str) -> Tuple[List[str], np.ndarray]:
+        """(ids, unit vectors) of the facts tracked on a topic; fetched and embedded on first use."""
+        with self._cache_lock:
+            cached = self._topic_fact_vecs.get(topic)
+        if cached is not None:
+            return cached
+        
+        ids, texts = [], []
+        try:
+            results = self.search_client.search(
+                search_text="*",
+                filter=f"topic eq '{topic}' and thread_id eq '{self.thread_id}' and recordType eq 'shared_fact'",
+                select=["id", "fact"]
+            )
+            for r in results:
+                ids.append(r["id"])
+                texts.append(r["fact"])
+        except Exception as e:
+            print(f"⚠️ Error finding similar facts: {e}")
+            return [], np.empty((0, EMBEDDING_DIM), dtype=np.float32)  # not cached, retried next time
+        
+        vecs = normalize_rows(memory_manager.get_embeddings(texts)) if texts else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        with self._cache_lock:
+            return self._topic_fact_vecs.setdefault(topic, (ids, vecs))
+    
+    def _remember_fact_vectors(self, topic: str, ids: List[str], vecs: np.ndarray):
+        """Append newly indexed facts to their topic's cached vectors (if that topic is cached)."""
+        with self._cache_lock:
+            cached = self._topic_fact_vecs.get(topic)
+            if cached is not None:
+                self._topic_fact_vecs[topic] = (cached[0] + ids, np.vstack([cached[1], vecs]))
+    
     def _find_similar_facts(self, fact: str, threshold: float = 0.85) -> List[Dict]:
         """Find semantically similar facts to prevent duplication."""
         if not self.search_client:
@@ -269,12 +605,14 @@ class ConversationTracker:
     
     def get_shared_facts(self, topic: str, after_timestamp: Optional[str] = None) -> List[SharedFact]:
         """Get all facts shared about a topic, optionally after a specific timestamp."""
-        # First check cache
-        cached_facts = [f for f in self._fact_cache.values() if f.topic == topic]
+        # First check cache (already sorted by shared_at, so just reverse)
+        with self._cache_lock:
+            columns = self._topic_facts.get(topic)
+            cached_facts = columns.facts[::-1] if columns else []
         
         # If we have cache and no temporal filter, return from cache
         if cached_facts and not after_timestamp:
-            return sorted(cached_facts, key=lambda f: f.shared_at, reverse=True)
+            return cached_facts
         
         # Otherwise query Azure Search
         if not self.search_client:
@@ -317,7 +655,7 @@ class ConversationTracker:
                 facts.append(fact)
                 
                 # Update cache
-                self._fact_cache[fact.fact_hash] = fact
+                self._cache_fact(fact)
             
             return facts
             
@@ -360,12 +698,13 @@ class ConversationTracker:
                 "session_id": self.session_id
             }
             
+            if self._buffer("upload", doc, lambda: self._turn_indexed(topic, timestamp)):
+                return
+            
             result = self.search_client.upload_documents(documents=[doc])
             if result[0].succeeded:
                 print(f"✅ Tracked conversation turn")
-                # Update caches
-                self._last_discussion_times[topic] = timestamp
-                self._topics_cache.add(topic)
+                self._turn_indexed(topic, timestamp)
                 
                 # Force a small delay to ensure indexing
                 time.sleep(0.5)
@@ -374,11 +713,115 @@ class ConversationTracker:
         except Exception as e:
             print(f"❌ Error tracking conversation: {e}")
     
+    def commit_turn(self, topic: str, query: str, response: str, sources: List[str],
+                    fact_ids: List[str] = None, prefs: Optional[Dict[str, Any]] = None):
+        """
+        Record a conversation turn and any preference updates in a single
+        indexing request (turn upload + preference merge_or_upload).
+        """
+        self._commit_turns([(topic, query, response, sources, fact_ids or [])], prefs or {})
+    
+    def _commit_turns(self, turns: List[Tuple[str, str, str, List[str], List[str]]], prefs: Dict[str, Any]):
+        """Upload (topic, query, response, sources, fact_ids) turns plus preference updates in one batch."""
+        if not self.search_client:
+            self._preference_cache.update(prefs)
+            return
+        
+        timestamp = datetime.now(timezone.utc).isoformat()
+        
+        batch = IndexDocumentsBatch()
+        batch.add_upload_actions([
+            {
+                "id": str(uuid.uuid4()),
+                "topic": topic,
+                "query": query,
+                "response": response,
+                "timestamp": timestamp,
+                "sources": sources,
+                "facts_shared": fact_ids,
+                "thread_id": self.thread_id,
+                "recordType": "conversation_turn",
+                "session_id": self.session_id
+            }
+            for topic, query, response, sources, fact_ids in turns
+        ])
+        if prefs:
+            batch.add_merge_or_upload_actions([
+                {
+                    "id": f"pref_{self.thread_id}_{self._encode_key(key)}",
+                    "thread_id": self.thread_id,
+                    "preference_key": key,
+                    "preference_value": json.dumps(value),
+                    "timestamp": timestamp,
+                    "recordType": "user_preference",
+                    "session_id": self.session_id
+                }
+                for key, value in prefs.items()
+            ])
+        
+        try:
+            results = self.search_client.index_documents(batch)
+            for (topic, *_), turn_result in zip(turns, results):
+                if turn_result.succeeded:
+                    print(f"✅ Tracked conversation turn")
+                    # Update caches
+                    self._last_discussion_times[topic] = timestamp
+                    self._topics_cache.add(topic)
+                else:
+                    print(f"❌ Failed to track conversation: {turn_result.error_message}")
+            self._invalidate_queries()
+            
+            # Force a small delay to ensure indexing
+            time.sleep(0.5)
+        except Exception as e:
+            print(f"❌ Error tracking conversation: {e}")
+        
+        # Preferences are cached even if Azure fails, as in update_preference
+        self._preference_cache.update(prefs)
+    
+    def bulk_apply(self, jobs: List["TrackingJob"]) -> List[List[str]]:
+        """
+        Apply queued tracking jobs in order with two requests in total: one bulk
+        fact upload and one batch of turns + merged preference updates.
+        Returns, per job, a fact ID (or None if not stored) for each of its facts.
+        """
+        if not jobs:
+            return []
+        
+        # One bulk upload for every job's facts, split back per job
+        all_facts = [fact for job in jobs for fact in job.facts]
+        all_ids = self.add_shared_facts_bulk(all_facts)
+        fact_ids_per_job = []
+        offset = 0
+        for job in jobs:
+            job_ids = all_ids[offset:offset + len(job.facts)]
+            offset += len(job.facts)
+            fact_ids_per_job.append(job_ids)
+        
+        # Later jobs win for the same preference key; interactions are counted here
+        prefs: Dict[str, Any] = {}
+        for job in jobs:
+            prefs.update(job.prefs)
+        prefs["interaction_count"] = self.get_interaction_count() + len(jobs)
+        
+        self._commit_turns(
+            [
+                (job.topic, job.query, job.response, job.sources, [fid for fid in ids if fid])
+                for job, ids in zip(jobs, fact_ids_per_job)
+            ],
+            prefs
+        )
+        return fact_ids_per_job
+    
     def get_conversation_history(self, topic: str, limit: int = 10) -> List[Dict]:
         """Get conversation history for a topic."""
         if not self.search_client:
             return []
         
+        return self._cached_query(("history", topic, limit), lambda: self._query_history(topic, limit))
+    
+    def _query_history(self, topic: str, limit: int) -> List[Dict]:
+        """Conversation history for a topic, straight from Azure Search."""
         try:
             results = self.search_client.search(
                 search_text="*",
@@ -409,10 +852,14 @@ class ConversationTracker:
         if topic in self._last_discussion_times:
             return self._last_discussion_times[topic]
         
-        # If not in cache, query Azure Search
+        # If not in cache, query Azure Search (a miss is remembered briefly too)
         if not self.search_client:
             return None
         
+        return self._cached_query(("last_discussion", topic), lambda: self._query_last_discussion_time(topic))
+    
+    def _query_last_discussion_time(self, topic: str) -> Optional[str]:
+        """Timestamp of the latest turn on a topic, straight from Azure Search."""
         try:
             results = self.search_client.search(
                 search_text="*",
@@ -438,10 +885,14 @@ class ConversationTracker:
         if self._topics_cache:
             return list(self._topics_cache)
         
-        # Otherwise query Azure Search
+        # Otherwise query Azure Search (an empty thread is remembered briefly too)
         if not self.search_client:
             return []
         
+        return self._cached_query(("topics",), self._query_all_topics)
+    
+    def _query_all_topics(self) -> List[str]:
+        """Topics of every conversation turn in this thread, straight from Azure Search."""
         try:
             # Get topics by searching for all conversation turns
             results = self.search_client.search(
@@ -483,6 +934,9 @@ class ConversationTracker:
                 "session_id": self.session_id
             }
             
+            if self._buffer("merge_or_upload", doc, lambda: self._preference_cache.__setitem__(key, value)):
+                return
+            
             result = self.search_client.merge_or_upload_documents(documents=[doc])
             if result[0].succeeded:
                 self._preference_cache[key] = value
@@ -539,10 +993,13 @@ class ConversationTracker:
         """Force a refresh of cached data from Azure Search."""
         print("🔄 Forcing data refresh from Azure Search...")
         # Clear caches
-        self._fact_cache.clear()
+        with self._cache_lock:
+            self._fact_cache.clear()
+            self._topic_facts.clear()
         self._preference_cache.clear()
         self._last_discussion_times.clear()
         self._topics_cache.clear()
+        self._invalidate_queries()
         
         # Reload data
         self._load_historical_data()
@@ -11,14 +11,28 @@ from azure.search.documents.indexes.models import (
     VectorSearch,
     VectorSearchProfile,
     HnswAlgorithmConfiguration,
-    HnswParameters
+    HnswParameters,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters
 )
+from vector_ops import EMBEDDING_DIM
 
 # ─── CONFIG ──────────────────────────
 endpoint = os.environ["AZURE_SEARCH_ENDPOINT"]
 api_key  = os.environ["AZURE_SEARCH_API_KEY"]
 client   = SearchIndexClient(endpoint, AzureKeyCredential(api_key))
 
+# HNSW knobs for the default profile; the field can also be pointed at the
+# low-RAM (m=8) or high-recall (m=32) profile below
+HNSW_M         = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))  # 128 trades latency for recall
+HNSW_PROFILE   = os.getenv("HNSW_PROFILE", "hnsw-config")  # hnsw-config | hnsw-lowmem | hnsw-recall
+
+# The app's warm memory cache (memory_cache.py) reads contentVector back from the
+# index; set STORE_CONTENT_VECTORS=0 to drop that retrievable copy when the
+# cache isn't needed (searches still work, the vectors just can't be returned)
+STORE_VECTORS  = os.getenv("STORE_CONTENT_VECTORS", "1") != "0"
+
 # ─── FIELDS ──────────────────────────
 fields = [
     # the document key
@@ -73,8 +87,9 @@ fields = [
         name="contentVector",
         type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
         searchable=True,
-        vector_search_dimensions=1536,
-        vector_search_profile_name="hnsw-config"
+        vector_search_dimensions=EMBEDDING_DIM,  # EMBEDDING_DIMENSIONS, 1536 for ada-002
+        vector_search_profile_name=HNSW_PROFILE,
+        stored=STORE_VECTORS
     )
 ]
 
@@ -82,19 +97,42 @@ fields = [
 vector_search = VectorSearch(
     profiles=[
         VectorSearchProfile(
-            name="hnsw-config",
-            algorithm_configuration_name="hnsw-config"
+            name=name,
+            algorithm_configuration_name=name,
+            compression_name="sq-int8"
         )
+        for name in ("hnsw-config", "hnsw-lowmem", "hnsw-recall")
     ],
     algorithms=[
         HnswAlgorithmConfiguration(
             name="hnsw-config",
             parameters=HnswParameters(
-                m=4,
+                m=HNSW_M,  # denser graph: fewer probes per query for the same recall
                 ef_construction=400,
-                ef_search=100,
+                ef_search=HNSW_EF_SEARCH,  # callers ask for ~k*4 neighbours, so a shorter walk suffices
                 metric="cosine"
             )
+        ),
+        # Smaller graph for low-RAM deployments
+        HnswAlgorithmConfiguration(
+            name="hnsw-lowmem",
+            parameters=HnswParameters(m=8, ef_construction=400, ef_search=HNSW_EF_SEARCH, metric="cosine")
+        ),
+        # Denser graph and longer walk when recall matters more than latency
+        HnswAlgorithmConfiguration(
+            name="hnsw-recall",
+            parameters=HnswParameters(m=32, ef_construction=400, ef_search=128, metric="cosine")
+        )
+    ],
+    # int8 scalar quantization: the HNSW graph stores 1 byte per dimension
+    # instead of 4; the service oversamples candidates and reranks them
+    # against the original float vectors to recover recall
+    compressions=[
+        ScalarQuantizationCompression(
+            compression_name="sq-int8",
+            rerank_with_original_vectors=True,
+            default_oversampling=4.0,
+            parameters=ScalarQuantizationParameters(quantized_data_type="int8")
         )
     ]
 )
@@ -115,10 +153,13 @@ try:
     print("   - web_content: Information from web searches")
     print("   - Other custom categories as needed")
     print("\n🔧 Features:")
-    print("   - Vector search with cosine similarity")
+    print(f"   - Vector search with cosine similarity (int8 scalar quantization, profile {HNSW_PROFILE})")
     print("   - Full-text search on content and summaries")
     print("   - Filtering by category and timestamp")
     print("   - Support for web content metadata (URL, title)")
+    if not STORE_VECTORS:
+        print("   - contentVector not stored (warm memory cache disabled)")
 except Exception as e:
     print(f"❌ Error updating index: {e}")
-    print("💡 Make sure your Azure Search credentials are correct in .env file")
\ No newline at end of file
+    print("💡 Make sure your Azure Search credentials are correct in .env file")
+    print("💡 Compression can't be added to an existing vector field - delete and recreate the index if needed")
\ No newline at end of file
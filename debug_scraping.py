@@ -4,8 +4,18 @@ Debug what content is actually being scraped
 Run: python debug_scraping.py
 """
 
+try:
+    # RE2 matches in linear time, so scraped pages can't trigger catastrophic backtracking
+    import re2 as re
+except ImportError:
+    import re
+
 from web_search import search_and_scrape
 
+TEMP_RE = re.compile(r'\b\d{1,2}°[CF]\b')
+# All weather indicators in one alternation, so the content is scanned once
+INDICATOR_RE = re.compile(r'°|degrees|temperature|weather|forecast')
+
 # Test scraping
 print("🔍 Testing web scraping for weather...\n")
 
@@ -24,17 +34,17 @@ if results:
         
         # Check for weather indicators
         content_lower = result['content'].lower()
+        found = set(INDICATOR_RE.findall(content_lower))
         
         print("\n🔍 Weather indicators check:")
-        print(f"- Has temperature (°): {'°' in result['content']}")
-        print(f"- Has 'degrees': {'degrees' in content_lower}")
-        print(f"- Has 'temperature': {'temperature' in content_lower}")
-        print(f"- Has 'weather': {'weather' in content_lower}")
-        print(f"- Has 'forecast': {'forecast' in content_lower}")
+        print(f"- Has temperature (°): {'°' in found}")
+        print(f"- Has 'degrees': {'degrees' in found}")
+        print(f"- Has 'temperature': {'temperature' in found}")
+        print(f"- Has 'weather': {'weather' in found}")
+        print(f"- Has 'forecast': {'forecast' in found}")
         
         # Look for numbers that might be temperatures
-        import re
-        temps = re.findall(r'\b\d{1,2}°[CF]\b', result['content'])
+        temps = TEMP_RE.findall(result['content'])
         if temps:
             print(f"\n🌡️ Found temperatures: {temps[:5]}")
 else:
@@ -6,10 +6,22 @@ Run: python debug_search.py "weather in paris today"
 
 import sys
 import os
+
+try:
+    # RE2 matches in linear time, so scraped pages can't trigger catastrophic backtracking
+    import re2 as re
+except ImportError:
+    import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
+TEMPERATURE_WORDS = {'°', 'degrees', 'temperature'}
+WEATHER_WORDS = {'weather', 'forecast', 'conditions'}
+# All weather indicators in one alternation, so the content is scanned once
+INDICATOR_RE = re.compile('|'.join(TEMPERATURE_WORDS | WEATHER_WORDS))
+LOCATION_RE = re.compile(r'(?:weather\s+(?:in\s+)?|in\s+)([a-zA-Z\s]+?)(?:\s+today|\s+right|\s*$)', re.IGNORECASE)
+
 # Add current directory to path
 sys.path.append('.')
 
@@ -76,13 +88,13 @@ def debug_search(query):
                 
                 # Detailed weather checks
                 content_lower = content.lower()
+                found = set(INDICATOR_RE.findall(content_lower))
                 print("\nDetailed checks:")
-                print(f"- Has temperature: {'Yes' if any(x in content_lower for x in ['°', 'degrees', 'temperature']) else 'No'}")
-                print(f"- Has weather words: {'Yes' if any(x in content_lower for x in ['weather', 'forecast', 'conditions']) else 'No'}")
+                print(f"- Has temperature: {'Yes' if found & TEMPERATURE_WORDS else 'No'}")
+                print(f"- Has weather words: {'Yes' if found & WEATHER_WORDS else 'No'}")
                 
                 # Check location
-                import re
-                location_match = re.search(r'(?:weather\s+(?:in\s+)?|in\s+)([a-zA-Z\s]+?)(?:\s+today|\s+right|\s*$)', query, re.IGNORECASE)
+                location_match = LOCATION_RE.search(query)
                 if location_match:
                     location = location_match.group(1).strip().lower()
                     print(f"- Location '{location}' in content: {'Yes' if location in content_lower else 'No'}")
@@ -1,38 +1,66 @@
 # File: graph_setup.py
 
 import os
-from typing import TypedDict, List, Dict, Optional
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from dataclasses import dataclass, field
+from typing import Annotated, List, Dict, Optional
 from dotenv import load_dotenv
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_chat_compat import ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
+from http_pool import SHARED_HTTP
+from langchain_core.runnables import RunnableConfig
+from langchain_core.prompts import ChatPromptTemplate
 
 import memory_manager
 from web_search import should_search_web, search_and_scrape
-from context_manager import ContextManagerLLM, QueryAnalysis
+from context_manager import get_context_manager, QueryAnalysis
 # from azure_search_retriever_simple import SimpleAzureSearchRetriever  # Not currently used
 
 # ─── Load environment variables ────────────────────────────────
 load_dotenv()
 
 # ─── Initialize components ──────────────────────────────────────
-llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.1)
+llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.1, http_client=SHARED_HTTP)
+
+# Response messages: parsed once, filled per turn
+RESPONSE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "{system_prompt}"),
+    ("human", "{query}")
+])
 
 # ─── 1) Define enhanced state schema ────────────────────────────
-class ChatState(TypedDict):
-    messages: List[str]                # All chat lines (user + assistant)
-    memories: List[str]                # Long-term facts or summaries  
-    current_query: str                 # Current user query
-    query_analysis: Dict               # Basic analysis results
-    context_analysis: Optional[QueryAnalysis]  # Enhanced context analysis
-    retrieved_memories: List[Dict]     # Retrieved memories
-    web_results: Optional[List]        # Web search results if any
-    response: str                      # Generated response
-    thread_id: str                     # User/session identifier
-    session_id: str                    # Session ID for persistence
-    dynamic_prompt: str                # Context-aware prompt
+@dataclass(frozen=True)
+class ReplaceMessages:
+    """Messages update that replaces the whole history (used once it has been summarized)."""
+    lines: List[str]
+
+def add_messages_bounded(existing: List[str], new) -> List[str]:
+    """Messages reducer: append this turn's lines, or swap in a compacted history."""
+    if isinstance(new, ReplaceMessages):
+        return list(new.lines)
+    return (existing or []) + (new or [])
+
+# Nodes get the state as a slotted dataclass (LangGraph builds it from the
+# channel values), so fields are plain attribute reads; nodes still return
+# partial update dicts. Every field needs a default: channels that haven't
+# been written yet are simply absent from the values LangGraph passes in.
+@dataclass(slots=True)
+class ChatState:
+    messages: Annotated[List[str], add_messages_bounded] = field(default_factory=list)  # Recent chat lines (user + assistant), bounded
+    memories: List[str] = field(default_factory=list)      # Long-term facts or summaries  
+    current_query: str = ""                                # Current user query
+    query_analysis: Dict = field(default_factory=dict)     # Basic analysis results
+    context_analysis: Optional[QueryAnalysis] = None       # Enhanced context analysis
+    retrieved_memories: List[memory_manager.Memory] = field(default_factory=list)  # Retrieved memories
+    web_results: Optional[List] = None                     # Web search results if any
+    response: str = ""                                     # Generated response
+    thread_id: str = ""                                    # User/session identifier
+    session_id: Optional[str] = None                       # Session ID for persistence
+    dynamic_prompt: str = ""                               # Context-aware prompt
 
 # ─── 2) Note: Azure Search retriever is defined but not currently used ────
 # The memory_manager handles all retrieval internally
@@ -50,31 +78,31 @@ checkpointer = MemorySaver()
 # ─── 4) Build the LangGraph with context-aware workflow ─────────
 builder = StateGraph(ChatState)
 
-def context_analysis_node(state: ChatState) -> ChatState:
+def context_analysis_node(state: ChatState) -> Dict:
     """Analyze query with full conversation context."""
     print("🧠 Analyzing with Context Manager...")
     
-    # Initialize context manager with session ID
-    context_manager = ContextManagerLLM(
-        state["thread_id"], 
-        state.get("session_id")
+    # Per-thread context manager (cached, so the tracker history loads once)
+    context_manager = get_context_manager(
+        state.thread_id, 
+        state.session_id
     )
     
     # Get initial memories for context
     initial_memories = memory_manager.retrieve_memories(
-        state["current_query"], 
+        state.current_query, 
         k=5,  # Fewer memories for context analysis
         include_personal_facts=True
     )
     
-    # Perform deep context analysis
+    # Perform deep context analysis (one timestamp for the whole turn)
+    now = datetime.now(timezone.utc)
     context_analysis = context_manager.analyze_query_with_context(
-        state["current_query"],
-        initial_memories
+        state.current_query,
+        initial_memories,
+        now=now
     )
     
-    state["context_analysis"] = context_analysis
-    
     # Log analysis results
     print(f"📊 Context Analysis:")
     print(f"   Query Type: {context_analysis.query_type}")
@@ -85,21 +113,20 @@ def context_analysis_node(state: ChatState) -> ChatState:
     
     # Check for proactive updates
     topic = context_analysis.conversation_context["topic"]
-    should_update, update_msg = context_manager.should_proactively_update(topic)
+    should_update, update_msg = context_manager.should_proactively_update(topic, now=now)
     if should_update:
         print(f"💡 Proactive update available: {update_msg}")
     
-    return state
+    return {"context_analysis": context_analysis}
 
-def enhanced_analyze_node(state: ChatState) -> ChatState:
+def enhanced_analyze_node(state: ChatState) -> Dict:
     """Enhanced analysis using context manager results."""
     print("🔍 Processing enhanced analysis...")
     
-    # Store user message
-    memory_manager.store_memory(state["current_query"], memory_type="user_message")
+    # The user message itself is stored by the caller, concurrently with this run
     
     # Use enhanced query from context analysis
-    enhanced_query = state["context_analysis"].enhanced_query
+    enhanced_query = state.context_analysis.enhanced_query
     
     # Retrieve memories with enhanced query
     memories = memory_manager.retrieve_memories(
@@ -107,141 +134,143 @@ def enhanced_analyze_node(state: ChatState) -> ChatState:
         k=8,
         include_personal_facts=True
     )
-    state["retrieved_memories"] = memories
     
     # Basic search decision (can be overridden by context analysis)
-    if state["context_analysis"].requires_search:
+    if state.context_analysis.requires_search:
         # Use the context-enhanced query for search decision
         analysis = {
             "needs_search": True,
             "search_query": enhanced_query,
-            "query_type": state["context_analysis"].query_type,
-            "reason": state["context_analysis"].user_intent
+            "query_type": state.context_analysis.query_type,
+            "reason": state.context_analysis.user_intent
         }
     else:
         analysis = {
             "needs_search": False,
             "search_query": "",
-            "query_type": state["context_analysis"].query_type,
+            "query_type": state.context_analysis.query_type,
             "reason": "Context analysis determined no search needed"
         }
     
-    state["query_analysis"] = analysis
-    
-    return state
+    return {"retrieved_memories": memories, "query_analysis": analysis}
 
-def context_aware_search_node(state: ChatState) -> ChatState:
-    """Perform web search with context constraints."""
-    if state["query_analysis"].get("needs_search", False):
-        print("🌐 Performing context-aware web search...")
-        
-        # Get search constraints from context analysis
-        constraints = state["context_analysis"].search_constraints
-        search_query = state["query_analysis"].get("search_query", state["current_query"])
-        
-        # Apply constraints to search query
-        for constraint in constraints:
-            if constraint.startswith("NOT "):
-                # Skip NOT constraints for search query
-                continue
-            elif constraint.startswith("after:"):
-                search_query += f" {constraint}"
-        
-        print(f"🔍 Enhanced search query: '{search_query}'")
-        
-        # Special handling for different query types
-        query_type = state["context_analysis"].query_type
-        
-        if query_type == "stock":
-            web_results = search_for_stock_price(search_query)
-        elif query_type == "update_since_last":
-            # Add temporal filtering
-            last_time = state["context_analysis"].conversation_context.get("last_discussion")
-            if last_time:
-                search_query += f" after:{last_time[:10]}"
-            web_results = search_and_scrape(search_query, num_urls=3)
-        else:
-            web_results = search_and_scrape(search_query, num_urls=3)
-        
-        if web_results:
-            state["web_results"] = web_results
-            # Store web content
-            memory_manager.store_web_content(web_results, search_query)
-            # Re-retrieve to include fresh content
-            state["retrieved_memories"] = memory_manager.retrieve_memories(
-                state["current_query"], 
-                k=8,
-                include_personal_facts=True
-            )
+def _store_and_embed_query(web_results: List[Dict[str, str]], search_query: str, query: str) -> List[float]:
+    """
+    Store the web results and embed the user's query concurrently. Only the
+    vector search has to wait for the upload; the query embedding doesn't.
+    """
+    query_vec = memory_manager.prefetch_executor.submit(memory_manager.get_embedding, query)
+    memory_manager.store_web_content(web_results, search_query)
+    return query_vec.result()
+
+def context_aware_search_node(state: ChatState) -> Dict:
+    """Perform web search with context constraints (only routed here when a search is needed)."""
+    print("🌐 Performing context-aware web search...")
+    
+    # Get search constraints from context analysis
+    constraints = state.context_analysis.search_constraints
+    search_query = state.query_analysis.get("search_query", state.current_query)
+    
+    # Apply "after:" constraints to search query ("NOT " ones don't go in the query)
+    after_parts = [c for c in constraints if c.startswith("after:")]
+    if after_parts:
+        search_query = " ".join([search_query, *after_parts])
+    
+    print(f"🔍 Enhanced search query: '{search_query}'")
+    
+    # Special handling for different query types
+    query_type = state.context_analysis.query_type
+    
+    if query_type == "stock":
+        web_results = search_for_stock_price(search_query)
+    elif query_type == "update_since_last":
+        # Add temporal filtering
+        last_time = state.context_analysis.conversation_context.get("last_discussion")
+        if last_time:
+            search_query += f" after:{last_time[:10]}"
+        web_results = search_and_scrape(search_query, num_urls=3)
     else:
-        state["web_results"] = None
-        print("💭 No search needed based on context analysis")
+        web_results = search_and_scrape(search_query, num_urls=3)
     
-    return state
+    # Always write web_results: LangGraph rejects a node update that writes no state key
+    updates = {"web_results": web_results or None}
+    if web_results:
+        # Store web content, embedding the query for the re-retrieval meanwhile
+        query_vec = _store_and_embed_query(web_results, search_query, state.current_query)
+        # Re-retrieve to include fresh content
+        updates["retrieved_memories"] = memory_manager.retrieve_memories(
+            state.current_query, 
+            k=8,
+            include_personal_facts=True,
+            query_vec=query_vec
+        )
+    
+    return updates
 
-def generate_context_aware_response_node(state: ChatState) -> ChatState:
+def generate_context_aware_response_node(state: ChatState, config: RunnableConfig) -> Dict:
     """Generate response with dynamic context-aware prompt."""
     print("💭 Generating context-aware response...")
     
-    # Get context manager
-    context_manager = ContextManagerLLM(
-        state["thread_id"],
-        state.get("session_id")
+    # Get context manager (same cached instance context_analysis_node used)
+    context_manager = get_context_manager(
+        state.thread_id,
+        state.session_id
     )
     
     # Generate dynamic prompt
     dynamic_prompt = context_manager.generate_dynamic_prompt(
-        state["context_analysis"],
-        state["retrieved_memories"],
-        state["web_results"]
+        state.context_analysis,
+        state.retrieved_memories,
+        state.web_results
     )
     
-    state["dynamic_prompt"] = dynamic_prompt
-    
     # Build system prompt based on query type and context
-    query_type = state["context_analysis"].query_type
+    query_type = state.context_analysis.query_type
     base_prompt = build_context_aware_system_prompt(
         query_type, 
         dynamic_prompt, 
-        bool(state["web_results"]),
-        state["context_analysis"]
+        bool(state.web_results),
+        state.context_analysis
     )
     
-    # Generate response
+    # Generate response - streamed, so callbacks in the run config
+    # (e.g. the /chat/stream endpoint) receive tokens as they arrive
     try:
-        response = llm.invoke([
-            SystemMessage(content=base_prompt),
-            HumanMessage(content=state["current_query"])
-        ])
-        state["response"] = response.content.strip()
+        chunks = []
+        messages = RESPONSE_PROMPT.format_messages(system_prompt=base_prompt, query=state.current_query)
+        for chunk in llm.stream(messages, config=config):
+            chunks.append(chunk.content)
+        response = "".join(chunks).strip()
         
         # Track the response
         sources = []
-        if state["web_results"]:
-            sources = [result.get("url", "") for result in state["web_results"]]
+        if state.web_results:
+            sources = [result.get("url", "") for result in state.web_results]
         
         context_manager.track_response(
-            state["current_query"],
-            state["response"],
+            state.current_query,
+            response,
             sources
         )
         
     except Exception as e:
         print(f"❌ Error generating response: {e}")
-        state["response"] = "I apologize, but I encountered an error. Please try again."
+        response = "I apologize, but I encountered an error. Please try again."
     
-    return state
+    return {
+        "response": response,
+        "dynamic_prompt": dynamic_prompt,
+        "messages": [f"Assistant: {response}"]
+    }
 
-def search_for_stock_price(query: str) -> List[Dict[str, str]]:
-    """Specialized search for stock prices."""
-    # Extract company name
-    company = "Renault" if "renault" in query.lower() else query.split()[0]
-    
-    # Try to get stock information
-    try:
-        if "renault" in company.lower():
-            symbol = "RNO.PA"
-            content = f"""Based on available information, Renault (RNO.PA) stock information:
+def summarize_history_node(state: ChatState) -> Dict:
+    """Fold the oldest chat lines into a summary once the history is over the cap."""
+    if len(state.messages) <= memory_manager.MAX_STATE_MESSAGES:
+        return {"messages": []}
+    return {"messages": ReplaceMessages(memory_manager.summarize_if_needed(state.messages))}
+
+# Canned stock notes, keyed by the lowercase name that triggers them
+RENAULT_STOCK_NOTE = """Based on available information, Renault (RNO.PA) stock information:
 - Renault shares have experienced volatility recently
 - The company lowered its 2025 guidance which impacted share price
 - For real-time stock prices, please check:
@@ -250,26 +279,49 @@ def search_for_stock_price(query: str) -> List[Dict[str, str]]:
   • Your broker's platform
 
 Note: Real-time stock data requires specialized financial data feeds."""
-            
-            return [{
-                'url': 'https://finance.yahoo.com/quote/RNO.PA',
-                'title': 'Renault Stock Information',
-                'content': content,
-                'query_type': 'stock'
-            }]
-    except:
-        pass
+
+STOCK_TABLE = {
+    "renault": ("RNO.PA", "Renault Stock Information", RENAULT_STOCK_NOTE),
+}
+STOCK_RE = re.compile("|".join(map(re.escape, STOCK_TABLE)))
+
+def search_for_stock_price(query: str) -> List[Dict[str, str]]:
+    """Specialized search for stock prices."""
+    match = STOCK_RE.search(query.lower())
+    if match:
+        symbol, title, content = STOCK_TABLE[match.group(0)]
+        return [{
+            'url': f'https://finance.yahoo.com/quote/{symbol}',
+            'title': title,
+            'content': content,
+            'query_type': 'stock'
+        }]
     
     # Fallback to regular search
     return search_and_scrape(query, num_urls=2)
 
+# Extra instruction appended to the system prompt for some query types
+QUERY_TYPE_SUFFIXES = {
+    "follow_up": "This is a follow-up question. Only provide NEW information not previously shared.",
+    "clarification": "The user is asking for clarification. Focus on explaining or expanding on previous information.",
+    "update_since_last": "Only provide information that is newer than what was previously discussed."
+}
+
 def build_context_aware_system_prompt(query_type: str, dynamic_content: str, 
                                     has_web_results: bool, context_analysis: QueryAnalysis) -> str:
     """Build system prompt with context awareness."""
-    
+    return _prompt_template(query_type, context_analysis.is_personal_query).format(
+        dynamic_content=dynamic_content,
+        prompt_instructions=context_analysis.prompt_instructions,
+        user_intent=context_analysis.user_intent
+    )
+
+@lru_cache(maxsize=32)
+def _prompt_template(query_type: str, is_personal_query: bool) -> str:
+    """The static prompt frame for a query type; the per-turn content is filled in by the caller."""
     # Base prompt varies by query type
-    if context_analysis.is_personal_query and query_type == "personal_fact":
-        base = f"""You are a helpful assistant with conversation memory.
+    if is_personal_query and query_type == "personal_fact":
+        base = """You are a helpful assistant with conversation memory.
 
 {dynamic_content}
 
@@ -279,38 +331,41 @@ When answering personal fact queries:
 - Be direct and concise
 - If the fact is not known, say "I don't have that information" """
     else:
-        base = f"""You are an intelligent assistant with conversation memory.
+        base = """You are an intelligent assistant with conversation memory.
 
 {dynamic_content}
 
 CRITICAL INSTRUCTIONS:
-1. {context_analysis.prompt_instructions}
-2. Focus on the user's specific intent: {context_analysis.user_intent}
+1. {prompt_instructions}
+2. Focus on the user's specific intent: {user_intent}
 3. Do not repeat information already shared with the user
 4. If no new information is available, clearly state this"""
 
     # Add query-type specific instructions
-    if query_type == "follow_up":
-        base += "\n\nThis is a follow-up question. Only provide NEW information not previously shared."
-    elif query_type == "clarification":
-        base += "\n\nThe user is asking for clarification. Focus on explaining or expanding on previous information."
-    elif query_type == "update_since_last":
-        base += "\n\nOnly provide information that is newer than what was previously discussed."
-    
-    return base
+    suffix = QUERY_TYPE_SUFFIXES.get(query_type)
+    return "\n\n".join([base, suffix]) if suffix else base
+
+def route_after_analysis(state: ChatState) -> str:
+    """Skip the search node entirely when the analysis decided no search is needed."""
+    if state.query_analysis.get("needs_search", False):
+        return "context_search"
+    print("💭 No search needed based on context analysis")
+    return "context_respond"
 
 # Add nodes to the graph
 builder.add_node("context_analyze", context_analysis_node)
 builder.add_node("enhanced_analyze", enhanced_analyze_node)
 builder.add_node("context_search", context_aware_search_node)
 builder.add_node("context_respond", generate_context_aware_response_node)
+builder.add_node("summarize_history", summarize_history_node)
 
 # Define the workflow
 builder.add_edge(START, "context_analyze")
 builder.add_edge("context_analyze", "enhanced_analyze")
-builder.add_edge("enhanced_analyze", "context_search")
+builder.add_conditional_edges("enhanced_analyze", route_after_analysis, ["context_search", "context_respond"])
 builder.add_edge("context_search", "context_respond")
-builder.add_edge("context_respond", END)
+builder.add_edge("context_respond", "summarize_history")
+builder.add_edge("summarize_history", END)
 
 # ─── 5) Compile with persistence ───────────────────────────────
 graph = builder.compile(checkpointer=checkpointer)
\ No newline at end of file
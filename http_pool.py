@@ -0,0 +1,28 @@
+# http_pool.py
+"""
+Process-wide pooled HTTP client shared by the OpenAI and ChatOpenAI clients,
+so every embedding / chat call reuses warm keep-alive connections instead of
+paying a fresh TCP + TLS handshake.
+"""
+
+import atexit
+import httpx
+
+try:
+    # HTTP/2 needs the optional h2 package; fall back to pooled HTTP/1.1 without it
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+# Sized for the app's worker pools (chat background, scrape, embedding prefetch)
+# all calling out at once; a dead host fails fast on connect instead of after 30 s
+SHARED_HTTP = httpx.Client(
+    http2=HTTP2_ENABLED,
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+)
+
+atexit.register(SHARED_HTTP.close)
+
+__all__ = ['SHARED_HTTP', 'HTTP2_ENABLED']
@@ -0,0 +1,31 @@
+# json_compat.py
+"""
+JSON helpers that use orjson when it is installed and fall back to the
+standard library otherwise. Dumps always return bytes.
+"""
+
+import json
+
+try:
+    # orjson is a faster drop-in: it parses and encodes straight to/from bytes
+    import orjson
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def dumps_sorted(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+except ImportError:
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    def dumps_sorted(obj) -> bytes:
+        return json.dumps(obj, sort_keys=True).encode("utf-8")
+
+__all__ = ['loads', 'dumps', 'dumps_sorted']
@@ -0,0 +1,121 @@
+# memory_cache.py
+"""
+In-process cache of every memory document and its embedding.
+
+Warmed once in a background thread at startup by paging through the Azure
+index; after that, vector retrieval is a local cosine scan over one
+contiguous float32 matrix instead of a search round-trip. New memories are
+appended as they are uploaded, so Azure stays the durable copy.
+
+The cache is per process: with several workers, each holds its own copy and
+only sees the memories that process uploaded (plus what was in the index at
+warm-up). Writes from other workers, and any deletions from the index, are
+not picked up until the process restarts.
+"""
+
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from vector_ops import EMBEDDING_DIM, normalize_rows, cosine_topk
+
+# Fields mirrored from the index (contentVector is kept separately as a matrix row)
+CACHE_FIELDS = ["id", "content", "memoryCategory", "memorySummary", "timestamp", "source_url", "title"]
+
+CACHE_READY = False
+# Row-normalized vectors; only the first _cache_rows rows are filled. The
+# buffer doubles when full, so appends don't copy the whole matrix each time.
+CACHE_VECS = np.empty((1024, EMBEDDING_DIM), dtype=np.float32)
+CACHE_DOCS: List[Dict] = []
+_cache_rows = 0
+
+_cache_lock = threading.Lock()
+_cached_ids = set()
+
+def _split(docs: List[Dict]):
+    """Separate documents with a usable vector into (metadata dicts, vectors)."""
+    metas, vecs = [], []
+    for doc in docs:
+        vec = doc.get("contentVector")
+        if not vec or doc.get("id") in _cached_ids:
+            continue
+        metas.append({field: doc.get(field, "") for field in CACHE_FIELDS})
+        vecs.append(vec)
+    return metas, vecs
+
+def add_documents(docs: List[Dict]):
+    """Append freshly uploaded documents (with contentVector) to the cache."""
+    global CACHE_VECS, _cache_rows
+
+    with _cache_lock:
+        metas, vecs = _split(docs)
+        if not metas:
+            return
+        end = _cache_rows + len(metas)
+        if end > len(CACHE_VECS):
+            # Grow into a new buffer; views handed out by search() keep the old one
+            grown = np.empty((max(end, 2 * len(CACHE_VECS)), EMBEDDING_DIM), dtype=np.float32)
+            grown[:_cache_rows] = CACHE_VECS[:_cache_rows]
+            CACHE_VECS = grown
+        CACHE_VECS[_cache_rows:end] = normalize_rows(vecs)
+        _cache_rows = end
+        CACHE_DOCS.extend(metas)
+        _cached_ids.update(meta["id"] for meta in metas)
+
+def _warm(search_client):
+    """Page the whole index into memory, then flip CACHE_READY."""
+    global CACHE_READY
+
+    try:
+        results = search_client.search(
+            search_text="*",
+            select=CACHE_FIELDS + ["contentVector"]
+        )
+        batch = []
+        seen = 0
+        for page in results.by_page():
+            batch.extend(page)
+            if len(batch) >= 1000:
+                seen += len(batch)
+                add_documents(batch)
+                batch = []
+        seen += len(batch)
+        add_documents(batch)
+
+        if seen and not CACHE_DOCS:
+            # Index built with STORE_CONTENT_VECTORS=0: vectors aren't retrievable
+            print("⚠️ Memory index doesn't return contentVector, using Azure Search for retrieval")
+            return
+
+        CACHE_READY = True
+        print(f"✅ Memory cache warmed with {len(CACHE_DOCS)} memories")
+    except Exception as e:
+        print(f"⚠️ Memory cache warm-up failed, using Azure Search for retrieval: {e}")
+
+def start_warming(search_client):
+    """Kick off the cache warm-up in a daemon thread (no-op without a client)."""
+    if search_client is None:
+        return
+    threading.Thread(target=_warm, args=(search_client,), name="memory-cache-warm", daemon=True).start()
+
+def by_category(category: str) -> List[Dict]:
+    """Every cached memory of one category (a local filter, no similarity ranking)."""
+    with _cache_lock:
+        return [dict(doc) for doc in CACHE_DOCS if doc.get("memoryCategory") == category]
+
+def search(q_vec, k: int) -> List[Dict]:
+    """
+    Top-k cached memories by cosine similarity, shaped like Azure Search hits
+    (including "@search.score" and the unit-length "contentVector").
+    """
+    with _cache_lock:
+        vecs, docs = CACHE_VECS[:_cache_rows], CACHE_DOCS[:]
+
+    q = np.asarray(q_vec, dtype=np.float32)
+    top = cosine_topk(q, vecs, k)
+    if len(top) == 0:
+        return []
+    q_norm = np.linalg.norm(q) or 1.0
+    scores = vecs[top] @ (q / q_norm)
+    return [{**docs[i], "@search.score": float(score), "contentVector": vecs[i]} for i, score in zip(top, scores)]
@@ -1,13 +1,28 @@
-import os, uuid
+import os, re, uuid
+import atexit
+import copy
+import asyncio
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timezone
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Any
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
 from dotenv import load_dotenv
+import tiktoken
 
 from openai import OpenAI
 from langchain_chat_compat import ChatOpenAI
+from http_pool import SHARED_HTTP
+import memory_cache
+from vector_ops import EMBEDDING_DIM, normalize_rows, dedup_mask
+from ttl_cache import TTLLRUCache
+from json_compat import loads as _json_loads
 from langchain.schema import SystemMessage, HumanMessage
 
 load_dotenv()
@@ -24,6 +39,8 @@ except Exception as e:
     print(f"⚠️ Error initializing Azure Search client: {e}")
     search_client = None
 
+FACT_MODEL = "gpt-3.5-turbo-1106"  # 1106+ supports JSON mode (response_format)
+
 try:
     # Initialize OpenAI client - simplified initialization
     api_key = os.getenv("OPENAI_API_KEY")
@@ -31,11 +48,20 @@ try:
         raise ValueError("OPENAI_API_KEY not found in environment variables")
     
     # Simple initialization without proxy complications
-    openai_client = OpenAI(api_key=api_key)
+    openai_client = OpenAI(api_key=api_key, http_client=SHARED_HTTP)
     llm = ChatOpenAI(
         model_name="gpt-3.5-turbo", 
         temperature=0, 
-        api_key=api_key
+        api_key=api_key,
+        http_client=SHARED_HTTP
+    )
+    # JSON mode: the fact analysis always comes back as one strict JSON object
+    fact_llm = ChatOpenAI(
+        model_name=FACT_MODEL,
+        temperature=0,
+        api_key=api_key,
+        http_client=SHARED_HTTP,
+        model_kwargs={"response_format": {"type": "json_object"}}
     )
     print("✅ OpenAI clients initialized successfully")
     
@@ -43,29 +69,270 @@ except Exception as e:
     print(f"❌ Error initializing OpenAI: {e}")
     openai_client = None
     llm = None
+    fact_llm = None
+
+# text-embedding-3-* models can return shortened (Matryoshka) vectors, e.g.
+# EMBEDDING_MODEL=text-embedding-3-small EMBEDDING_DIMENSIONS=768 halves the
+# vector payload; the memory index must be recreated with the same dimensions
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBED_KWARGS = {"dimensions": EMBEDDING_DIM} if EMBEDDING_MODEL.startswith("text-embedding-3") else {}
+
+class EmbeddingCache(TTLLRUCache):
+    """
+    Content-keyed cache of embeddings (SHA-256 of model + text). Embeddings are
+    deterministic, so repeat texts skip the OpenAI round trip; entries are
+    LRU-bounded and expire after `ttl` seconds.
+    """
+    
+    def __init__(self, max_size: int = 4096, ttl: float = 3600):
+        super().__init__(max_size, ttl)
+    
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(f"{EMBEDDING_MODEL}/{EMBEDDING_DIM}\0{text}".encode("utf-8")).hexdigest()
+    
+    def _store(self, vector: list) -> Tuple[float, ...]:
+        return tuple(vector)
+    
+    def _load(self, vector: Tuple[float, ...]) -> list:
+        return list(vector)  # fresh list, so callers can't mutate the cached vector
+
+embedding_cache = EmbeddingCache()
+
+# Shared stand-in for a failed or empty embedding (callers never mutate vectors)
+ZERO_EMBEDDING: List[float] = [0.0] * EMBEDDING_DIM
+
+# Single-flight: one OpenAI request per text at a time; concurrent callers for the
+# same text (e.g. the query embedding and the stored message's prefetch) wait on it
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
 
 def get_embedding(text: str) -> list[float]:
-    """Generate embedding for text using OpenAI."""
+    """Generate embedding for text using OpenAI (cached by content, coalesced while in flight)."""
     if not openai_client:
         print("❌ OpenAI client not initialized")
-        return [0.0] * 1536  # Return dummy embedding
+        return ZERO_EMBEDDING  # Return dummy embedding
+    
+    if not text or text.isspace():
+        return ZERO_EMBEDDING  # Nothing to embed
+    
+    key = embedding_cache.make_key(text)
+    cached = embedding_cache.get(key)
+    if cached is not None:
+        return cached
     
+    with _inflight_lock:
+        pending = _inflight.get(key)
+        if pending is None:
+            cached = embedding_cache.get(key)  # a request may have just finished
+            if cached is not None:
+                return cached
+            _inflight[key] = Future()
+    if pending is not None:
+        return pending.result()
+    
+    embedding = ZERO_EMBEDDING  # Return dummy embedding on failure (not cached)
     try:
         resp = openai_client.embeddings.create(
-            model="text-embedding-ada-002", 
-            input=text
+            model=EMBEDDING_MODEL, 
+            input=text,
+            **EMBED_KWARGS
         )
-        return resp.data[0].embedding
+        embedding = resp.data[0].embedding
+        embedding_cache.set(key, embedding)
     except Exception as e:
         print(f"❌ Error generating embedding: {e}")
-        return [0.0] * 1536  # Return dummy embedding
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key).set_result(embedding)
+    return embedding
+
+def get_embeddings(texts: List[str]) -> List[list[float]]:
+    """Generate embeddings for several texts; cache misses go out in a single OpenAI request."""
+    if not openai_client:
+        print("❌ OpenAI client not initialized")
+        return [ZERO_EMBEDDING] * len(texts)  # Return dummy embeddings
+    
+    keys = [embedding_cache.make_key(text) for text in texts]
+    embeddings = [ZERO_EMBEDDING if not text or text.isspace() else embedding_cache.get(key)
+                  for text, key in zip(texts, keys)]
+    # Each distinct uncached text is sent once, however often it repeats in the batch
+    missing: Dict[str, List[int]] = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            missing.setdefault(keys[i], []).append(i)
+    if not missing:
+        return embeddings
+    
+    try:
+        resp = openai_client.embeddings.create(
+            model=EMBEDDING_MODEL, 
+            input=[texts[slots[0]] for slots in missing.values()],
+            **EMBED_KWARGS
+        )
+        for (key, slots), item in zip(missing.items(), sorted(resp.data, key=lambda item: item.index)):
+            embedding_cache.set(key, item.embedding)
+            for i in slots:
+                embeddings[i] = item.embedding
+    except Exception as e:
+        print(f"❌ Error generating embeddings: {e}")
+        for slots in missing.values():
+            for i in slots:
+                embeddings[i] = ZERO_EMBEDDING  # Return dummy embeddings
+    return embeddings
+
+# ─── Document IDs ───
+# Time-ordered UUIDv7 keys (48-bit ms timestamp + random bits); the random
+# bits come from a pooled os.urandom read instead of one syscall per document
+_ID_POOL_SIZE = 256
+_id_pool = b""
+_id_pool_lock = threading.Lock()
+
+def new_memory_id() -> str:
+    """A fresh UUIDv7 string for a memory document."""
+    global _id_pool
+    
+    if hasattr(uuid, "uuid7"):  # Python 3.14+
+        return str(uuid.uuid7())
+    
+    with _id_pool_lock:
+        if not _id_pool:
+            _id_pool = os.urandom(10 * _ID_POOL_SIZE)
+        rand, _id_pool = _id_pool[:10], _id_pool[10:]
+    
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(rand, "big")
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+    return str(uuid.UUID(int=value))
+
+# Same switch as create_memory_index.py: contentVector can only be selected
+# back from the index when it was built with stored vectors
+VECTORS_RETRIEVABLE = os.getenv("STORE_CONTENT_VECTORS", "1") != "0"
+# Retrieved memories closer than this (cosine) to a better-scored one are dropped
+DEDUP_SIMILARITY = 0.92
+
+# store_memory queues documents here; they are embedded with one API call
+# and uploaded with one request once the batch fills up or the delay expires
+EMBED_BATCH_SIZE = 16
+EMBED_FLUSH_DELAY = 0.2  # seconds
+
+_pending: List[Dict] = []
+_pending_lock = threading.Lock()
+_flush_timer: Optional[threading.Timer] = None
+# Held across take-batch + upload, so batches reach the index in queue order
+# even when the timer and a full batch trigger flushes at the same time
+_flush_lock = threading.Lock()
+
+def _queue_document(doc: Dict):
+    """Queue a document for batched embedding + upload. Its content is what gets embedded."""
+    global _flush_timer
+    
+    with _pending_lock:
+        _pending.append(doc)
+        flush_now = len(_pending) >= EMBED_BATCH_SIZE
+        if not flush_now and _flush_timer is None:
+            _flush_timer = threading.Timer(EMBED_FLUSH_DELAY, flush_pending_memories)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+    
+    if flush_now:
+        flush_pending_memories()
+
+def flush_pending_memories():
+    """Embed and upload every queued document in one batch."""
+    global _flush_timer
+    
+    with _flush_lock:
+        with _pending_lock:
+            batch = _pending[:]
+            _pending.clear()
+            if _flush_timer is not None:
+                _flush_timer.cancel()
+                _flush_timer = None
+        
+        if not batch or not search_client:
+            return
+        
+        vectors = get_embeddings([doc["content"] for doc in batch])
+        for doc, vec in zip(batch, vectors):
+            doc["contentVector"] = vec
+        
+        try:
+            results = search_client.upload_documents(documents=batch)
+            stored = [doc for doc, result in zip(batch, results) if result.succeeded]
+            memory_cache.add_documents(stored)
+            _remember_user_facts([doc for doc in stored if doc["memoryCategory"] == "personal_fact"])
+            for doc, result in zip(batch, results):
+                if not result.succeeded:
+                    print(f"❌ Failed to store memory: {result.status_code}")
+                elif doc["memoryCategory"] == "personal_fact":
+                    print(f"🌟 Stored {doc['title']}: {doc['content']}")
+                else:
+                    print(f"✅ Stored {doc['memoryCategory']} memory: {doc['content'][:50]}...")
+        except Exception as e:
+            print(f"❌ Error storing {len(batch)} memories: {e}")
+
+# Drain anything still queued when the process exits
+atexit.register(flush_pending_memories)
+
+# Embeds a message while its fact analysis is still running (the vector lands
+# in embedding_cache, so the batch flush doesn't request it again); also runs
+# the personal-fact query alongside the main one in retrieve_memories
+prefetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="embed-prefetch")
+
+# ─── Fact extraction patterns (compiled once) ───
+NAME_PATTERNS = [
+    re.compile(r"(?:my name is|i am|i'm)\s+([a-zA-Z]+)", re.IGNORECASE),
+    re.compile(r"(?:call me|they call me)\s+([a-zA-Z]+)", re.IGNORECASE),
+]
+WORK_PATTERNS = [
+    re.compile(r"(?:i work at|i work for|employed at|working at)\s+([a-zA-Z\s]+?)(?:\.|,|$|;)", re.IGNORECASE),
+    re.compile(r"(?:i'm at|i am at)\s+([a-zA-Z\s]+?)(?:\.|,|$|;)", re.IGNORECASE),
+]
+COLOR_PATTERNS = [
+    re.compile(r"my favorite color is\s+([a-zA-Z]+)", re.IGNORECASE),
+    re.compile(r"favorite color:\s*([a-zA-Z]+)", re.IGNORECASE),
+    re.compile(r"i love the color\s+([a-zA-Z]+)", re.IGNORECASE),
+]
+
+# A personal fact is stated in the first person ("i like", "i'm from", "my son"),
+# so a message without one of these phrasings skips the LLM
+_FACT_NOUNS = (
+    r"(?:name|job|work|company|employer|birthday|age|home|hometown|favou?rite|wife|husband|partner"
+    r"|kids?|children|sons?|daughters?|pets?|dogs?|cats?)"
+)
+FACT_TRIGGER_RE = re.compile(
+    r"\b(?:call me|years old"
+    r"|i(?:['’]m| am| was)"
+    r"|i (?:\w+ )?(?:work(?:ed)?|live[ds]?|love|like|prefer|hate|own|moved|married)"
+    r"|i have (?:\w+ )?" + _FACT_NOUNS +
+    r"|my (?:\w+ )?" + _FACT_NOUNS + r")\b",
+    re.IGNORECASE
+)
+# Unambiguous single-fact phrasings the regex extraction handles on its own
+CLEAR_FACT_RE = re.compile(
+    r"\b(?:my name is|i work at|i work for|employed at|working at|my favorite color is|favorite color:|i love the color)(?!\w)",
+    re.IGNORECASE
+)
+# Compound statements ("... and ...", "... but ...") still go to the LLM
+CONJUNCTION_RE = re.compile(r"\b(?:and|but)\b|,", re.IGNORECASE)
+JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
 
 def analyze_user_facts(text: str) -> List[Dict[str, str]]:
     """
     Use LLM to analyze if a message contains personal facts worth remembering.
     Now returns a LIST of facts to handle compound statements.
+    Chit-chat and simple single-fact statements are answered by regex without the LLM.
     """
-    if not llm:
+    if not FACT_TRIGGER_RE.search(text):
+        return []
+    
+    if CLEAR_FACT_RE.search(text) and not CONJUNCTION_RE.search(text):
+        facts = fallback_fact_extraction(text)
+        if len(facts) == 1:
+            return facts
+    
+    if not fact_llm:
         print("⚠️ LLM not initialized, using fallback fact extraction")
         return fallback_fact_extraction(text)
     
@@ -96,23 +363,18 @@ Examples:
 """
 
     try:
-        response = llm.invoke([
+        response = fact_llm.invoke([
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"Message: {text}")
         ])
         
-        import json
+        # JSON mode guarantees a bare object; the regex only rescues stray text
         content = response.content.strip()
-        
-        # Handle potential JSON extraction issues
-        if '{' in content and '}' in content:
-            # Extract JSON from response
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            json_str = content[start:end]
-            result = json.loads(json_str)
-        else:
-            result = {"facts": []}
+        try:
+            result = _json_loads(content)
+        except ValueError:
+            json_match = JSON_OBJECT_RE.search(content)
+            result = _json_loads(json_match.group()) if json_match else {"facts": []}
         
         return result.get("facts", [])
     except Exception as e:
@@ -127,13 +389,8 @@ def fallback_fact_extraction(text: str) -> List[Dict[str, str]]:
     text_lower = text.lower()
     
     # Extract name
-    import re
-    name_patterns = [
-        r"(?:my name is|i am|i'm)\s+([a-zA-Z]+)",
-        r"(?:call me|they call me)\s+([a-zA-Z]+)",
-    ]
-    for pattern in name_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in NAME_PATTERNS:
+        match = pattern.search(text)
         if match:
             facts.append({
                 "is_personal_fact": True,
@@ -144,12 +401,8 @@ def fallback_fact_extraction(text: str) -> List[Dict[str, str]]:
             break
     
     # Extract work/company
-    work_patterns = [
-        r"(?:i work at|i work for|employed at|working at)\s+([a-zA-Z\s]+?)(?:\.|,|$|;)",
-        r"(?:i'm at|i am at)\s+([a-zA-Z\s]+?)(?:\.|,|$|;)",
-    ]
-    for pattern in work_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in WORK_PATTERNS:
+        match = pattern.search(text)
         if match:
             company = match.group(1).strip()
             facts.append({
@@ -170,13 +423,8 @@ def fallback_fact_extraction(text: str) -> List[Dict[str, str]]:
         })
     
     # Extract color preferences
-    color_patterns = [
-        r"my favorite color is\s+([a-zA-Z]+)",
-        r"favorite color:\s*([a-zA-Z]+)",
-        r"i love the color\s+([a-zA-Z]+)",
-    ]
-    for pattern in color_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in COLOR_PATTERNS:
+        match = pattern.search(text)
         if match:
             facts.append({
                 "is_personal_fact": True,
@@ -215,49 +463,51 @@ def store_memory(text: str, memory_type: str = "user_message", metadata: Optiona
         print("❌ Search client not initialized, cannot store memory")
         return
     
+    if not text or text.isspace():
+        return  # Nothing worth embedding or remembering
+    
     # Analyze if this contains personal facts
     stored_facts = []
+    prefetch = None
     if memory_type == "user_message":
+        # The message embedding doesn't depend on the facts, so overlap the two calls
+        prefetch = prefetch_executor.submit(get_embedding, text)
         facts = analyze_user_facts(text)
         processed_facts = handle_fact_updates(facts)
         
-        # Store each fact separately for better retrieval
+        # Store each fact separately for better retrieval (once per distinct fact)
+        seen_facts = set()
         for fact in processed_facts:
             if fact.get("is_personal_fact", False):
-                fact_vec = get_embedding(fact["extracted_fact"])
+                fact_key = fact["extracted_fact"].strip().lower()
+                if not fact_key or fact_key in seen_facts:
+                    continue
+                seen_facts.add(fact_key)
                 fact_doc = {
-                    "id": str(uuid.uuid4()),
+                    "id": new_memory_id(),
                     "content": fact["extracted_fact"],
-                    "contentVector": fact_vec,
                     "memoryCategory": "personal_fact",
                     "memorySummary": fact["extracted_fact"],
                     "timestamp": datetime.now(timezone.utc).isoformat(),
                     "source_url": "",
                     "title": fact.get("fact_type", "personal_fact")
                 }
-                
-                try:
-                    result = search_client.upload_documents(documents=[fact_doc])
-                    if result[0].succeeded:
-                        print(f"🌟 Stored {fact['fact_type']}: {fact['extracted_fact']}")
-                        stored_facts.append(fact["extracted_fact"])
-                except Exception as e:
-                    print(f"❌ Error storing fact: {e}")
+                _queue_document(fact_doc)
+                stored_facts.append(fact["extracted_fact"])
     
     # Always store the original message too
-    vec = get_embedding(text)
-    
-    # Base document structure
+    # Base document structure (embedded when the batch is flushed)
     doc = {
-        "id": str(uuid.uuid4()),
+        "id": new_memory_id(),
         "content": text,
-        "contentVector": vec,
         "memoryCategory": memory_type,
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
     
     # Add metadata if provided
     if metadata:
+        if metadata.get("id"):
+            doc["id"] = metadata["id"]
         if "url" in metadata and metadata["url"]:
             doc["source_url"] = metadata["url"]
         if "title" in metadata and metadata["title"]:
@@ -277,17 +527,35 @@ def store_memory(text: str, memory_type: str = "user_message", metadata: Optiona
     if "title" not in doc:
         doc["title"] = ""
     
-    try:
-        result = search_client.upload_documents(documents=[doc])
-        if not result[0].succeeded:
-            raise RuntimeError(f"Failed to store memory: {result[0].status_code}")
-        print(f"✅ Stored {memory_type} memory: {text[:50]}...")
-    except Exception as e:
-        print(f"❌ Error storing memory: {e}")
+    if prefetch is not None:
+        prefetch.result()  # cached by now, so the flush only embeds the facts
+    _queue_document(doc)
+
+# Web pages are stored as overlapping token windows: each chunk gets a sharper
+# vector than a whole-page one, and all chunks of a page share the key prefix
+# "<parent id>_" so they can be grouped back together
+WEB_CHUNK_TOKENS = 512
+WEB_CHUNK_OVERLAP = 50
+
+@lru_cache(maxsize=1)
+def _token_encoding():
+    return tiktoken.encoding_for_model("text-embedding-ada-002")
+
+def chunk_text(text: str, chunk_size: int = WEB_CHUNK_TOKENS, overlap: int = WEB_CHUNK_OVERLAP) -> List[str]:
+    """Split text into windows of at most chunk_size tokens, overlapping by overlap tokens."""
+    encoding = _token_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= chunk_size:
+        return [text]
+    
+    step = chunk_size - overlap
+    return [encoding.decode(tokens[start:start + chunk_size]).strip()
+            for start in range(0, len(tokens) - overlap, step)]
 
 def store_web_content(scraped_results: List[Dict[str, str]], search_query: str):
     """
     Store web search results as memories with better formatting.
+    Long pages are split into overlapping chunks, one memory each.
     """
     if not search_client:
         print("❌ Search client not initialized, cannot store web content")
@@ -302,22 +570,80 @@ def store_web_content(scraped_results: List[Dict[str, str]], search_query: str):
         
         # Store the content directly without extra formatting
         # This makes it easier for the LLM to read
-        metadata = {
-            "url": result.get('url', ''),
-            "title": result.get('title', ''),
-            "search_query": search_query
-        }
-        
-        store_memory(
-            text=content,
-            memory_type="web_content", 
-            metadata=metadata
-        )
+        parent_id = new_memory_id()
+        for i, chunk in enumerate(chunk_text(content)):
+            metadata = {
+                "id": f"{parent_id}_{i}",
+                "url": result.get('url', ''),
+                "title": result.get('title', ''),
+                "search_query": search_query
+            }
+            
+            store_memory(
+                text=chunk,
+                memory_type="web_content", 
+                metadata=metadata
+            )
+    
+    # Upload now so the caller's follow-up retrieval can see the fresh content
+    flush_pending_memories()
+
+async def astore_web_content(scraped_results: List[Dict[str, str]], search_query: str):
+    """Async store_web_content (embedding + upload run in a worker thread)."""
+    await asyncio.to_thread(store_web_content, scraped_results, search_query)
+
+@dataclass(slots=True)
+class Memory:
+    """One retrieved memory, as returned by retrieve_memories."""
+    content: str
+    category: str
+    summary: str
+    timestamp: str
+    score: float
+    title: str
+    source_url: str = ""  # web content only
+
+# Azure retrieval fetches the newest PERSONAL_FACT_K personal facts by filter,
+# plus the k + DEDUP_HEADROOM nearest other memories
+PERSONAL_FACT_K = 20
+DEDUP_HEADROOM = 2
+RETRIEVE_FIELDS = ["id", "content", "memoryCategory", "memorySummary", "timestamp", "source_url", "title"]
+
+def _vector_search(query_vec: List[float], k: int, filter_expr: str) -> List[Dict]:
+    """Top-k Azure vector hits matching filter_expr (with contentVector when retrievable)."""
+    vector_query = VectorizedQuery(
+        vector=query_vec,
+        k_nearest_neighbors=k,
+        fields="contentVector",
+        exhaustive=False
+    )
+    return list(search_client.search(
+        search_text="*",
+        vector_queries=[vector_query],
+        filter=filter_expr,
+        top=k,
+        select=RETRIEVE_FIELDS + (["contentVector"] if VECTORS_RETRIEVABLE else [])
+    ))
 
-def retrieve_memories(query: str, k: int = 5, include_personal_facts: bool = True) -> List[Dict[str, any]]:
+def _personal_fact_search(filter_expr: str) -> List[Dict]:
+    """Newest personal facts matching filter_expr (filter-only: no vector query or transport)."""
+    return list(search_client.search(
+        search_text="*",
+        filter=filter_expr,
+        top=PERSONAL_FACT_K,
+        order_by=["timestamp desc"],
+        select=RETRIEVE_FIELDS
+    ))
+
+def retrieve_memories(query: str, k: int = 5, include_personal_facts: bool = True,
+                      filter_expr: Optional[str] = None,
+                      query_vec: Optional[List[float]] = None) -> List[Memory]:
     """
     Retrieve relevant memories using vector search.
     Now with smarter relevance filtering and deduplication.
+    An optional OData filter_expr narrows the candidate set before the ANN search;
+    pass query_vec if the query's embedding was already computed.
+    Personal facts (latest per type) are listed first and don't count toward k.
     """
     if not search_client:
         print("❌ Search client not initialized, returning empty memories")
@@ -325,68 +651,83 @@ def retrieve_memories(query: str, k: int = 5, include_personal_facts: bool = Tru
     
     try:
         # Generate query embedding
-        query_vec = get_embedding(query)
-        
-        # Create vector query - get more initially for filtering
-        vector_query = VectorizedQuery(
-            vector=query_vec,
-            k_nearest_neighbors=k * 3,  # Get extra for filtering
-            fields="contentVector"
-        )
+        if query_vec is None:
+            query_vec = get_embedding(query)
         
-        # Execute search
-        results = search_client.search(
-            search_text="*",
-            vector_queries=[vector_query],
-            top=k * 3,
-            select=["id", "content", "memoryCategory", "memorySummary", "timestamp", "source_url", "title"]
-        )
+        # Execute search - locally once the warm cache is loaded, else on Azure
+        if memory_cache.CACHE_READY and filter_expr is None:
+            # A local scan costs the same for any k, so over-fetch for filtering.
+            # Personal facts are taken by category, as in the Azure branch, so
+            # they don't depend on ranking among the nearest neighbours
+            results = [result for result in memory_cache.search(query_vec, k * 3)
+                       if result.get("memoryCategory") != "personal_fact"]
+            if include_personal_facts:
+                results += memory_cache.by_category("personal_fact")
+        else:
+            # Personal facts are few and keyed by type, so they come from a
+            # filter-only query (in parallel); only the rest goes through HNSW
+            scope = f" and ({filter_expr})" if filter_expr else ""
+            facts_future = None
+            if include_personal_facts:
+                facts_future = prefetch_executor.submit(
+                    _personal_fact_search, "memoryCategory eq 'personal_fact'" + scope
+                )
+            results = _vector_search(query_vec, k + DEDUP_HEADROOM, "memoryCategory ne 'personal_fact'" + scope)
+            if facts_future is not None:
+                results += facts_future.result()
         
         memories = []
         personal_facts = {}  # Use dict to deduplicate by fact type
-        seen_content = set()  # Deduplicate similar content
+        seen_content = set()  # Prefix fallback for hits without a vector
         
-        for result in results:
+        # Results arrive best-first, so semantic dedup keeps the better-scored copy
+        with_vec = [i for i, result in enumerate(results)
+                    if result.get("memoryCategory") != "personal_fact"
+                    and result.get("contentVector") is not None
+                    and len(result["contentVector"]) == EMBEDDING_DIM]
+        duplicates = set()
+        if len(with_vec) > 1:
+            keep = dedup_mask(normalize_rows([results[i]["contentVector"] for i in with_vec]), DEDUP_SIMILARITY)
+            duplicates = {i for i, kept in zip(with_vec, keep) if not kept}
+        
+        for idx, result in enumerate(results):
             content = result.get("content", "")
             category = result.get("memoryCategory", "unknown")
             
-            # Skip if we've seen very similar content
-            content_key = content[:100].lower().strip()
-            if content_key in seen_content and category != "personal_fact":
+            # Skip near-duplicates of a better-scored memory
+            if idx in duplicates:
                 continue
-            seen_content.add(content_key)
-            
-            memory = {
-                "content": content,
-                "category": category,
-                "summary": result.get("memorySummary", ""),
-                "timestamp": result.get("timestamp", ""),
-                "score": result.get("@search.score", 0.0),
-                "title": result.get("title", "")
-            }
+            if category != "personal_fact" and result.get("contentVector") is None:
+                content_key = content[:100].lower().strip()
+                if content_key in seen_content:
+                    continue
+                seen_content.add(content_key)
             
-            # Add web-specific metadata
-            if result.get("source_url"):
-                memory["source_url"] = result.get("source_url")
+            memory = Memory(
+                content=content,
+                category=category,
+                summary=result.get("memorySummary", ""),
+                timestamp=result.get("timestamp", ""),
+                score=result.get("@search.score", 0.0),
+                title=result.get("title", ""),
+                source_url=result.get("source_url") or ""  # web-specific metadata
+            )
             
             # Handle personal facts with deduplication
             if category == "personal_fact":
                 fact_type = result.get("title", "unknown")
                 # Keep only the most recent fact of each type
-                if fact_type not in personal_facts or memory["timestamp"] > personal_facts[fact_type]["timestamp"]:
+                if fact_type not in personal_facts or memory.timestamp > personal_facts[fact_type].timestamp:
                     personal_facts[fact_type] = memory
             else:
                 memories.append(memory)
         
+        # Hits arrive ranked (Azure / cache order), so limiting to k is a slice
+        final_memories = memories[:k]
+        
         # Combine deduplicated personal facts with other memories
         if include_personal_facts:
-            final_memories = list(personal_facts.values()) + memories
-        else:
-            final_memories = memories
-        
-        # Sort by score and limit to k
-        final_memories.sort(key=lambda x: x.get("score", 0), reverse=True)
-        final_memories = final_memories[:k]
+            final_memories = list(personal_facts.values()) + final_memories
         
         print(f"✅ Retrieved {len(final_memories)} relevant memories")
         if personal_facts:
@@ -398,7 +739,16 @@ def retrieve_memories(query: str, k: int = 5, include_personal_facts: bool = Tru
         print(f"❌ Error retrieving memories: {e}")
         return []
 
-def format_memories_for_prompt(memories: List[Dict[str, any]]) -> str:
+async def aretrieve_memories(query: str, k: int = 5, include_personal_facts: bool = True,
+                             filter_expr: Optional[str] = None,
+                             query_vec: Optional[List[float]] = None) -> List[Memory]:
+    """Async retrieve_memories (embedding + search run in a worker thread)."""
+    return await asyncio.to_thread(retrieve_memories, query, k, include_personal_facts, filter_expr, query_vec)
+
+# Order personal facts are listed in the prompt
+FACT_ORDER = ("name", "work", "preference", "location", "relationship", "other")
+
+def format_memories_for_prompt(memories: List[Memory]) -> str:
     """
     Format memories for the LLM prompt with clear structure.
     Now with better organization and deduplication.
@@ -411,21 +761,19 @@ def format_memories_for_prompt(memories: List[Dict[str, any]]) -> str:
     web_memories = []
     
     for mem in memories:
-        content = mem.get("content", "").strip()
+        content = mem.content.strip()
         if not content:
             continue
         
-        if mem.get("category") == "personal_fact":
+        if mem.category == "personal_fact":
             # Group personal facts by type
-            fact_type = mem.get("title", "other")
-            if fact_type not in personal_facts:
-                personal_facts[fact_type] = []
-            personal_facts[fact_type].append(mem.get("summary", content))
+            fact_type = mem.title or "other"
+            personal_facts.setdefault(fact_type, []).append(mem.summary or content)
             
-        elif mem.get("category") == "web_content":
+        elif mem.category == "web_content":
             # For web content, include the full content
-            title = mem.get("title", "Web Information")
-            source = mem.get("source_url", "")
+            title = mem.title or "Web Information"
+            source = mem.source_url
             
             # Format web memory clearly
             if "weather" in content.lower() or "temperature" in content.lower():
@@ -448,41 +796,33 @@ def format_memories_for_prompt(memories: List[Dict[str, any]]) -> str:
         formatted_sections.append("**User Facts:**")
         
         # Order facts logically
-        fact_order = ["name", "work", "preference", "location", "relationship", "other"]
-        for fact_type in fact_order:
-            if fact_type in personal_facts:
-                # Get the most recent fact of this type
-                latest_fact = personal_facts[fact_type][-1]  # Last one is most recent
-                
-                # Format based on type
-                if fact_type == "name":
-                    # Extract just the name
-                    if "Name:" in latest_fact:
-                        name = latest_fact.split("Name:")[-1].strip()
-                    else:
-                        name = latest_fact
-                    formatted_sections.append(f"- Name: {name}")
-                elif fact_type == "work":
-                    # Extract company
-                    if "Works at:" in latest_fact:
-                        company = latest_fact.split("Works at:")[-1].strip()
-                    else:
-                        company = latest_fact
-                    formatted_sections.append(f"- Works at: {company}")
-                elif fact_type == "preference":
-                    # Handle multiple preferences
-                    for pref in personal_facts[fact_type]:
-                        formatted_sections.append(f"- {pref}")
-                else:
-                    formatted_sections.append(f"- {latest_fact}")
+        for fact_type in FACT_ORDER:
+            facts = personal_facts.get(fact_type)
+            if not facts:
+                continue
+            # Get the most recent fact of this type
+            latest_fact = facts[-1]  # Last one is most recent
+            
+            # Format based on type
+            if fact_type == "name":
+                # Extract just the name
+                formatted_sections.append(f"- Name: {_fact_detail('name', latest_fact)}")
+            elif fact_type == "work":
+                # Extract company
+                company = latest_fact.partition("Works at:")[2].strip() if "Works at:" in latest_fact else latest_fact
+                formatted_sections.append(f"- Works at: {company}")
+            elif fact_type == "preference":
+                # Handle multiple preferences
+                formatted_sections.extend(f"- {pref}" for pref in facts)
+            else:
+                formatted_sections.append(f"- {latest_fact}")
     
     # Add user context if exists
     if user_memories:
         if formatted_sections:
             formatted_sections.append("")  # Add spacing
         formatted_sections.append("**Previous Conversation Context:**")
-        for mem in user_memories[:3]:
-            formatted_sections.append(f"- {mem}")
+        formatted_sections.extend(f"- {mem}" for mem in user_memories[:3])
     
     # Add web information with clear headers
     if web_memories:
@@ -493,14 +833,71 @@ def format_memories_for_prompt(memories: List[Dict[str, any]]) -> str:
     
     return "\n".join(formatted_sections)
 
+# get_user_context's result, built from Azure once and then kept current by
+# flush_pending_memories as new personal facts are uploaded
+_user_context_cache: Optional[Dict[str, any]] = None
+_user_context_lock = threading.Lock()
+
+def _empty_user_context() -> Dict[str, any]:
+    return {"name": None, "company": None, "facts": {}, "all_facts": []}
+
+def _fact_detail(fact_type: str, fact: str) -> Optional[str]:
+    """The name / company a name or work fact carries, else None."""
+    if fact_type == "name":
+        return fact.partition("Name:")[2].strip() if "Name:" in fact else fact
+    if fact_type == "work":
+        # Extract company name
+        if "Works at:" in fact:
+            return fact.partition("Works at:")[2].strip()
+        if "Renault" in fact:
+            return "Renault"
+    return None
+
+def _merge_user_fact(context: Dict[str, any], fact: str, fact_type: str, timestamp: str):
+    """Fold one personal fact into a user context dict (a newer fact of a type wins)."""
+    context["all_facts"].append({
+        "fact": fact,
+        "type": fact_type,
+        "timestamp": timestamp
+    })
+    
+    # Keep only the most recent fact of each type
+    if fact_type not in context["facts"] or timestamp > context["facts"][fact_type]["timestamp"]:
+        context["facts"][fact_type] = {
+            "fact": fact,
+            "timestamp": timestamp
+        }
+        
+        # Extract specific details
+        detail = _fact_detail(fact_type, fact)
+        if detail:
+            context["name" if fact_type == "name" else "company"] = detail
+
+def _remember_user_facts(docs: List[Dict]):
+    """Merge freshly uploaded personal_fact documents into the cached user context."""
+    with _user_context_lock:
+        if _user_context_cache is None:
+            return  # built from Azure on first use, which will include these
+        for doc in docs:
+            _merge_user_fact(_user_context_cache, doc["memorySummary"], doc["title"], doc["timestamp"])
+        _user_context_cache["all_facts"].sort(key=lambda f: f["timestamp"], reverse=True)
+
 def get_user_context() -> Dict[str, any]:
     """
     Retrieve all current personal facts about the user.
     Now handles fact updates properly.
+    Served from memory after the first call; new facts are merged in as they're stored.
+    Callers get their own copy, so the flush thread can keep merging into the cache.
     """
+    global _user_context_cache
+    
+    with _user_context_lock:
+        if _user_context_cache is not None:
+            return copy.deepcopy(_user_context_cache)
+    
     if not search_client:
         print("❌ Search client not initialized")
-        return {"name": None, "company": None, "facts": {}, "all_facts": []}
+        return _empty_user_context()
     
     try:
         # Search specifically for personal facts
@@ -512,47 +909,55 @@ def get_user_context() -> Dict[str, any]:
             order_by=["timestamp desc"]  # Most recent first
         )
         
-        context = {
-            "name": None,
-            "company": None,
-            "facts": {},
-            "all_facts": []
-        }
+        context = _empty_user_context()
         
         # Group facts by type, keeping only the most recent
         for result in results:
-            fact = result.get("memorySummary", result.get("content", ""))
-            fact_type = result.get("title", "other")
-            timestamp = result.get("timestamp", "")
-            
-            context["all_facts"].append({
-                "fact": fact,
-                "type": fact_type,
-                "timestamp": timestamp
-            })
-            
-            # Keep only the most recent fact of each type
-            if fact_type not in context["facts"] or timestamp > context["facts"][fact_type]["timestamp"]:
-                context["facts"][fact_type] = {
-                    "fact": fact,
-                    "timestamp": timestamp
-                }
-            
-            # Extract specific details
-            if fact_type == "name" and not context["name"]:
-                if "Name:" in fact:
-                    context["name"] = fact.split("Name:")[-1].strip()
-                else:
-                    context["name"] = fact
-            elif fact_type == "work" and not context["company"]:
-                # Extract company name
-                if "Works at:" in fact:
-                    context["company"] = fact.split("Works at:")[-1].strip()
-                elif "Renault" in fact:
-                    context["company"] = "Renault"
+            _merge_user_fact(
+                context,
+                result.get("memorySummary", result.get("content", "")),
+                result.get("title", "other"),
+                result.get("timestamp", "")
+            )
         
-        return context
+        with _user_context_lock:
+            if _user_context_cache is None:
+                _user_context_cache = context
+            return copy.deepcopy(_user_context_cache)
         
     except Exception as e:
         print(f"❌ Error getting user context: {e}")
-        return {"name": None, "company": None, "facts": {}, "all_facts": []}
\ No newline at end of file
+        return _empty_user_context()
+
+# ─── Conversation history compaction ───────────────────────────
+# The graph state keeps at most MAX_STATE_MESSAGES chat lines; once over the
+# cap, the oldest SUMMARIZE_CHUNK lines are folded into one "Summary:" line
+MAX_STATE_MESSAGES = 64
+SUMMARIZE_CHUNK = 32
+
+@lru_cache(maxsize=128)
+def _summarize_lines(lines: Tuple[str, ...]) -> str:
+    """Summarize a run of chat lines with one cheap LLM call (cached per excerpt)."""
+    if not llm:
+        return " | ".join(line[:80] for line in lines[-3:])
+    
+    response = llm.invoke([
+        SystemMessage(content="Summarize this conversation excerpt in 2-3 sentences. Keep names, personal facts, preferences and open questions."),
+        HumanMessage(content="\n".join(lines))
+    ])
+    return response.content.strip()
+
+def summarize_if_needed(messages: List[str], max_messages: int = MAX_STATE_MESSAGES) -> List[str]:
+    """
+    Keep the chat history bounded: while it is over max_messages, replace the
+    oldest SUMMARIZE_CHUNK lines (including any earlier summary) with a summary.
+    """
+    while len(messages) > max_messages:
+        oldest, rest = messages[:SUMMARIZE_CHUNK], messages[SUMMARIZE_CHUNK:]
+        try:
+            summary = _summarize_lines(tuple(oldest))
+        except Exception as e:
+            print(f"⚠️ Error summarizing conversation history: {e}")
+            summary = " | ".join(line[:80] for line in oldest[-3:])
+        messages = [f"Summary: {summary}"] + rest
+    return messages
@@ -95,24 +95,26 @@ def test_data_persistence():
         print("1️⃣ Creating first tracker and adding data...")
         tracker1 = ConversationTracker(test_thread)
         
-        # Add a fact
-        fact_id = tracker1.add_shared_fact(
-            topic=test_topic,
-            fact=test_fact,
-            source="test"
-        )
-        
-        # Add a conversation turn
-        tracker1.add_conversation_turn(
-            topic=test_topic,
-            query="Test query",
-            response="Test response",
-            sources=["test_source"],
-            fact_ids=[fact_id] if fact_id else []
-        )
-        
-        # Update a preference
-        tracker1.update_preference("test_pref", "test_value")
+        # All three writes go to Azure Search in one request when the block exits
+        with tracker1:
+            # Add a fact
+            fact_id = tracker1.add_shared_fact(
+                topic=test_topic,
+                fact=test_fact,
+                source="test"
+            )
+            
+            # Add a conversation turn
+            tracker1.add_conversation_turn(
+                topic=test_topic,
+                query="Test query",
+                response="Test response",
+                sources=["test_source"],
+                fact_ids=[fact_id] if fact_id else []
+            )
+            
+            # Update a preference
+            tracker1.update_preference("test_pref", "test_value")
         
         print("✅ Data added to first tracker")
         
@@ -174,17 +176,16 @@ def list_all_threads():
             AzureKeyCredential(os.environ["AZURE_SEARCH_API_KEY"])
         )
         
-        # Get all documents with thread_id
+        # One facet request: Azure aggregates the distinct thread_ids server-side
+        # and returns no rows (the facets live on the result object, so it's never iterated)
         results = client.search(
             search_text="*",
-            select=["thread_id"],
-            top=1000
+            facets=["thread_id,count:1000"],
+            select=["id"],
+            top=0
         )
         
-        threads = set()
-        for result in results:
-            if "thread_id" in result:
-                threads.add(result["thread_id"])
+        threads = {facet["value"] for facet in (results.get_facets() or {}).get("thread_id", [])}
         
         print(f"Found {len(threads)} unique threads:")
         for thread in sorted(list(threads))[:10]:  # Show first 10
@@ -5,33 +5,48 @@ Run: python test_duckduckgo.py
 """
 
 import requests
-from bs4 import BeautifulSoup
+import lxml.etree
+import lxml.html
+from concurrent.futures import ThreadPoolExecutor
 
-def search_duckduckgo_simple(query):
+# One keep-alive session shared by every query
+SESSION = requests.Session()
+SESSION.headers.update({'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'gzip, deflate'})
+
+# First result link of each result block, in one compiled XPath pass
+RESULT_LINKS = lxml.etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' links_main ')]"
+    "/descendant::a[contains(concat(' ', normalize-space(@class), ' '), ' result__a ')][1]"
+)
+
+def search_duckduckgo_simple(query, session=SESSION):
     """Simplest possible DuckDuckGo search."""
     
     print(f"🦆 Searching DuckDuckGo for: '{query}'")
     
-    # Send search request
-    response = requests.post(
+    # Send search request; the body is streamed straight into the parser
+    # (decompressed on the fly) instead of being buffered whole first
+    with session.post(
         "https://html.duckduckgo.com/html/",
-        headers={'User-Agent': 'Mozilla/5.0'},
-        data={'q': query}
-    )
+        data={'q': query},
+        stream=True
+    ) as response:
+        response.raw.decode_content = True
+        try:
+            tree = lxml.html.parse(response.raw).getroot()
+        except lxml.etree.XMLSyntaxError:  # empty body
+            return []
     
     # Parse results
-    soup = BeautifulSoup(response.text, 'html.parser')
-    results = []
-    
-    for result in soup.find_all('div', class_='links_main')[:5]:
-        link = result.find('a', class_='result__a')
-        if link:
-            results.append({
-                'title': link.text.strip(),
-                'url': link.get('href', '')
-            })
-    
-    return results
+    if tree is None:
+        return []
+    return [
+        {
+            'title': link.text_content().strip(),
+            'url': link.get('href', '')
+        }
+        for link in RESULT_LINKS(tree)[:5]
+    ]
 
 # Test it!
 print("🧪 Testing DuckDuckGo Search (FREE, NO API KEY!)\n")
@@ -42,9 +57,12 @@ test_queries = [
     "Python programming tutorial"
 ]
 
-for query in test_queries:
+# The queries are independent, so run them all at once
+with ThreadPoolExecutor(max_workers=len(test_queries)) as executor:
+    all_results = list(executor.map(search_duckduckgo_simple, test_queries))
+
+for query, results in zip(test_queries, all_results):
     print(f"\n📝 Query: {query}")
-    results = search_duckduckgo_simple(query)
     
     if results:
         print(f"✅ Found {len(results)} results:")
@@ -4,6 +4,7 @@ Test script to verify OpenAI client initialization with proxy workaround.
 """
 
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,40 +21,44 @@ if not api_key:
 else:
     print(f"✅ API key found (length: {len(api_key)})")
 
+PROXY_VARS = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
+
+@contextmanager
+def _without_proxies():
+    """Hide the proxy env vars for the duration of the block, then restore them."""
+    saved = {var: os.environ.pop(var) for var in PROXY_VARS if var in os.environ}
+    try:
+        yield
+    finally:
+        os.environ.update(saved)
+
 # Test 1: Basic initialization with proxy workaround
 print("\n1. Testing basic initialization with proxy fix...")
 try:
-    # Save proxy settings
-    saved_proxies = {}
-    proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
-    for var in proxy_vars:
-        if var in os.environ:
-            saved_proxies[var] = os.environ[var]
-            del os.environ[var]
-    
-    from openai import OpenAI
-    
-    # Restore proxy settings
-    for var, value in saved_proxies.items():
-        os.environ[var] = value
-    
-    # Create client
-    client = OpenAI(api_key=api_key)
+    # Create the client once, on the app's shared connection pool (http_pool.py);
+    # every test below reuses this instance instead of creating its own
+    with _without_proxies():
+        from openai import OpenAI
+        from http_pool import SHARED_HTTP
+        client = OpenAI(api_key=api_key, http_client=SHARED_HTTP)
     print("✅ OpenAI client created successfully!")
     
 except Exception as e:
     print(f"❌ Failed: {e}")
     exit(1)
 
-# Test 2: Create embedding
-print("\n2. Testing embedding creation...")
+# Test 2: Create embeddings (a list input shares one HTTP request)
+print("\n2. Testing batched embedding creation...")
 try:
+    texts = ["Hello, world!", "ping", "pong"]
     response = client.embeddings.create(
         model="text-embedding-ada-002",
-        input="Hello, world!"
+        input=texts
     )
+    if len(response.data) != len(texts):
+        raise ValueError(f"expected {len(texts)} embeddings, got {len(response.data)}")
     embedding_dim = len(response.data[0].embedding)
-    print(f"✅ Embedding created! Dimension: {embedding_dim}")
+    print(f"✅ {len(response.data)} embeddings created in one request! Dimension: {embedding_dim}")
     
 except Exception as e:
     print(f"❌ Failed to create embedding: {e}")
@@ -67,7 +72,8 @@ try:
     llm = ChatOpenAI(
         model_name="gpt-3.5-turbo",
         temperature=0,
-        api_key=api_key
+        api_key=api_key,
+        http_client=SHARED_HTTP
     )
     
     response = llm.invoke([HumanMessage(content="Say 'test successful' in 3 words")])
@@ -6,6 +6,7 @@ Run: python test_openai_search.py
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Add current directory to path
@@ -27,7 +28,7 @@ def test_openai_search():
     print("✅ OpenAI API key found")
     
     # Import after confirming API key
-    from web_search import openai_search, search_and_scrape, categorize_query_type
+    from web_search import search_duckduckgo, search_and_scrape, categorize_query_type
     
     # Test queries
     test_queries = [
@@ -36,15 +37,24 @@ def test_openai_search():
         "latest news about artificial intelligence"
     ]
     
-    for query in test_queries:
+    def run_one(query):
+        query_type = categorize_query_type(query)
+        results = search_duckduckgo(query)
+        scraped = search_and_scrape(query, num_urls=2, prefetched=results)
+        return query, query_type, results, scraped
+    
+    # The queries are independent: run their searches and scrapes
+    # concurrently, then report them in order
+    with ThreadPoolExecutor(max_workers=len(test_queries)) as executor:
+        outcomes = list(executor.map(run_one, test_queries))
+    
+    for query, query_type, results, scraped in outcomes:
         print(f"\n{'='*60}")
         print(f"Testing: {query}")
-        query_type = categorize_query_type(query)
         print(f"Query type: {query_type}")
         
-        # Test OpenAI search
-        print("\n1️⃣ Testing openai_search()...")
-        results = openai_search(query, query_type)
+        # Test the search step
+        print("\n1️⃣ Testing search_duckduckgo()...")
         
         if results:
             print(f"✅ Got {len(results)} results:")
@@ -57,7 +67,6 @@ def test_openai_search():
         
         # Test full search and scrape
         print("\n2️⃣ Testing search_and_scrape()...")
-        scraped = search_and_scrape(query, num_urls=2)
         
         if scraped:
             print(f"✅ Successfully scraped {len(scraped)} pages:")
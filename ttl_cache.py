@@ -0,0 +1,63 @@
+# ttl_cache.py
+"""
+Thread-safe LRU cache whose entries expire a fixed time after they are set.
+Shared by the embedding, query-analysis and reply caches; each subclass adds
+its own make_key() and, where cached values must not be mutated by callers,
+copies values in and out through _store() / _load().
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+class TTLLRUCache:
+    """LRU-bounded to `max_size` entries; an entry expires `ttl` seconds after it was set."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, value: Any) -> Any:
+        """The form a value is kept in (override to copy or freeze it)."""
+        return value
+
+    def _load(self, value: Any) -> Any:
+        """What get() hands back for a stored value (override to copy it)."""
+        return value
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._load(entry[1])
+
+    def set(self, key: str, value: Any):
+        stored = self._store(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+__all__ = ['TTLLRUCache']
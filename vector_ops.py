@@ -0,0 +1,58 @@
+# vector_ops.py
+"""
+Vectorized similarity helpers for local re-ranking of embeddings.
+Rows are stored L2-normalized as a contiguous float32 matrix, so cosine
+similarity against every row is a single BLAS matrix-vector product.
+"""
+
+import os
+
+import numpy as np
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Stack vectors into a C-contiguous float32 matrix with unit-length rows."""
+    M = np.ascontiguousarray(vectors, dtype=np.float32)
+    if M.ndim == 1:
+        M = M.reshape(1, -1)
+    norms = np.linalg.norm(M, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0  # zero vectors (failed embeddings) stay zero
+    return M / norms
+
+def cosine_topk(q: np.ndarray, M: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k rows of M most similar to q, best first.
+
+    M must already be row-normalized (see normalize_rows); q is normalized here.
+    """
+    n = M.shape[0]
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.intp)
+    q = np.asarray(q, dtype=np.float32)
+    q_norm = np.linalg.norm(q)
+    if q_norm:
+        q = q / q_norm
+    scores = M @ q
+    k = min(k, n)
+    # argpartition is O(n); only the k survivors get fully sorted
+    top = np.argpartition(scores, n - k)[n - k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+def dedup_mask(M: np.ndarray, threshold: float = 0.92) -> np.ndarray:
+    """
+    Greedy near-duplicate filter over row-normalized M, rows in priority order.
+
+    Row i is kept unless its cosine similarity to an earlier kept row exceeds
+    threshold. All pairwise similarities come from a single M @ M.T.
+    """
+    n = M.shape[0]
+    keep = np.ones(n, dtype=bool)
+    if n < 2:
+        return keep
+    S = M @ M.T
+    for i in range(1, n):
+        if (S[i, :i][keep[:i]] > threshold).any():
+            keep[i] = False
+    return keep
+
+# Must match the index's contentVector dimensions (see create_memory_index.py)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
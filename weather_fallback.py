@@ -4,7 +4,13 @@ Fallback solution: Use wttr.in for weather (no API key needed!)
 Run: python weather_fallback.py
 """
 
-import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from http_pool import SHARED_HTTP
+
+# wttr.in serves plain text to curl-like clients
+HEADERS = {'User-Agent': 'curl'}
+TIMEOUT = 5
 
 def get_weather_wttr(location: str) -> str:
     """
@@ -14,7 +20,7 @@ def get_weather_wttr(location: str) -> str:
     try:
         # Simple text format
         url = f"https://wttr.in/{location}?format=3"
-        response = requests.get(url, headers={'User-Agent': 'curl'})
+        response = SHARED_HTTP.get(url, headers=HEADERS, timeout=TIMEOUT)
         
         if response.status_code == 200:
             # Returns something like: "Paris: ⛅️ +22°C"
@@ -22,7 +28,7 @@ def get_weather_wttr(location: str) -> str:
         
         # Try more detailed format
         url = f"https://wttr.in/{location}?format=%l:+%c+%t+%h+%w"
-        response = requests.get(url, headers={'User-Agent': 'curl'})
+        response = SHARED_HTTP.get(url, headers=HEADERS, timeout=TIMEOUT)
         
         if response.status_code == 200:
             return response.text.strip()
@@ -37,8 +43,12 @@ print("🌤️ Testing wttr.in weather service (FREE, no API key!)\n")
 
 locations = ["Paris", "London", "Tokyo", "New York"]
 
-for location in locations:
-    weather = get_weather_wttr(location)
+# All lookups share the pooled client (one connection, multiplexed over HTTP/2
+# when h2 is installed), so they can run at once
+with ThreadPoolExecutor(max_workers=len(locations)) as executor:
+    forecasts = list(executor.map(get_weather_wttr, locations))
+
+for location, weather in zip(locations, forecasts):
     if weather:
         print(f"✅ {weather}")
     else:
@@ -50,7 +60,7 @@ print("\n💡 Add this to web_search.py as a fallback for weather queries!")
 print("\n📊 Detailed weather for Paris:")
 try:
     url = "https://wttr.in/Paris?format=Current+weather+in+%l:+%c+%t+(feels+like+%f)+Humidity:+%h+Wind:+%w"
-    response = requests.get(url, headers={'User-Agent': 'curl'})
+    response = SHARED_HTTP.get(url, headers=HEADERS, timeout=TIMEOUT)
     print(response.text)
 except Exception as e:
     print(f"Error: {e}")
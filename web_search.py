@@ -9,19 +9,36 @@ import os
 import re
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 from langchain_chat_compat import ChatOpenAI
+from http_pool import SHARED_HTTP
+from memory_manager import Memory
 from langchain.schema import SystemMessage, HumanMessage
 
 load_dotenv()
 
+# One keep-alive session for search, weather and scraping requests, so repeat
+# hosts skip the DNS/TCP/TLS setup; pool sized for the parallel scraper
+http_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+)
+http_session.mount("http://", _adapter)
+http_session.mount("https://", _adapter)
+
 # Initialize LLM for query analysis
-query_analyzer = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+query_analyzer = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, http_client=SHARED_HTTP)
 
-def extract_user_context(memories: List[Dict[str, any]]) -> Dict[str, str]:
+def extract_user_context(memories: List[Memory]) -> Dict[str, str]:
     """
     Extract user context from memories (name, company, preferences, etc.)
     """
@@ -35,8 +52,8 @@ def extract_user_context(memories: List[Dict[str, any]]) -> Dict[str, str]:
     }
     
     for mem in memories:
-        content = mem.get("content", "").lower()
-        original_content = mem.get("content", "")
+        content = mem.content.lower()
+        original_content = mem.content
         
         # Extract name
         if "my name is" in content or "i am" in content:
@@ -62,7 +79,7 @@ def extract_user_context(memories: List[Dict[str, any]]) -> Dict[str, str]:
     
     return context
 
-def analyze_query_with_llm(query: str, memories: List[Dict[str, any]]) -> Dict[str, any]:
+def analyze_query_with_llm(query: str, memories: List[Memory]) -> Dict[str, any]:
     """
     Use LLM to intelligently analyze the query and determine if web search is needed.
     Now includes user context awareness.
@@ -73,19 +90,19 @@ def analyze_query_with_llm(query: str, memories: List[Dict[str, any]]) -> Dict[s
     # Prepare memory context for the LLM
     memory_context = ""
     if memories:
-        web_memories = [m for m in memories if m.get("category") == "web_content"]
-        user_memories = [m for m in memories if m.get("category") == "user_message"]
+        web_memories = [m for m in memories if m.category == "web_content"]
+        user_memories = [m for m in memories if m.category == "user_message"]
         
         if user_memories:
             memory_context += "\nRecent user messages:\n"
             for i, mem in enumerate(user_memories[-5:]):  # Last 5 user messages
-                memory_context += f"- {mem.get('content', '')}\n"
+                memory_context += f"- {mem.content}\n"
         
         if web_memories:
             memory_context += f"\nExisting web content in memory (count: {len(web_memories)}):\n"
             for i, mem in enumerate(web_memories[:3]):
-                timestamp = mem.get("timestamp", "")
-                summary = mem.get("content", "")[:100] + "..."
+                timestamp = mem.timestamp
+                summary = mem.content[:100] + "..."
                 memory_context += f"{i+1}. {summary} (from: {timestamp})\n"
     
     # Build user context string
@@ -167,7 +184,7 @@ User Context:
         # Fallback to simplified keyword analysis
         return fallback_query_analysis(query, memories, user_context)
 
-def fallback_query_analysis(query: str, memories: List[Dict[str, any]], user_context: Dict[str, str]) -> Dict[str, any]:
+def fallback_query_analysis(query: str, memories: List[Memory], user_context: Dict[str, str]) -> Dict[str, any]:
     """
     Fallback keyword-based analysis if LLM fails.
     Now context-aware.
@@ -260,7 +277,7 @@ def get_weather_direct(location: str) -> Optional[str]:
             'format': 'Weather in %l: %t (feels like %f), %C. Humidity: %h, Wind: %w'
         }
         
-        response = requests.get(url, params=params, headers={'User-Agent': 'curl'}, timeout=5)
+        response = http_session.get(url, params=params, headers={'User-Agent': 'curl'}, timeout=5)
         
         if response.status_code == 200:
             weather_text = response.text.strip()
@@ -283,7 +300,7 @@ def search_duckduckgo(query: str, num_results: int = 5) -> List[Dict[str, str]]:
         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
         data = {'q': query}
         
-        response = requests.post(url, headers=headers, data=data, timeout=10)
+        response = http_session.post(url, headers=headers, data=data, timeout=10)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -317,7 +334,7 @@ def scrape_content(url: str, max_chars: int = 3000) -> Optional[str]:
             'Accept-Language': 'en-US,en;q=0.9'
         }
         
-        response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
+        response = http_session.get(url, headers=headers, timeout=10, allow_redirects=True)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.content, 'html.parser')
@@ -346,9 +363,20 @@ def scrape_content(url: str, max_chars: int = 3000) -> Optional[str]:
         print(f"⚠️  Error scraping {url}: {e}")
         return None
 
-def search_and_scrape(query: str, num_urls: int = 3) -> List[Dict[str, str]]:
+# Candidate pages are fetched concurrently; scraping is I/O bound
+scrape_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="scrape")
+
+# A search snippet quoting a temperature reading (a number with a unit, e.g.
+# "18°C" or "64 degrees F") already answers a weather query; a bare mention
+# of "degrees" doesn't
+_TEMPERATURE_RE = re.compile(r"-?\d+(?:\.\d+)?\s*(?:°|degrees?\b)", re.IGNORECASE)
+
+def search_and_scrape(query: str, num_urls: int = 3,
+                      prefetched: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
     """
     Enhanced search and scrape with weather fallback.
+    Pass search results already in hand (url/title/snippet dicts) as
+    `prefetched` to skip searching again.
     """
     
     query_type = categorize_query_type(query)
@@ -391,7 +419,7 @@ def search_and_scrape(query: str, num_urls: int = 3) -> List[Dict[str, str]]:
     # For non-weather queries, use DuckDuckGo
     print(f"🌐 Web search for: '{query}'")
     
-    search_results = search_duckduckgo(query)
+    search_results = prefetched if prefetched is not None else search_duckduckgo(query)
     
     if not search_results:
         print("❌ No search results")
@@ -407,14 +435,31 @@ def search_and_scrape(query: str, num_urls: int = 3) -> List[Dict[str, str]]:
                 }]
         return []
     
+    if query_type == "weather":
+        # Snippets that already quote a temperature are enough; skip the page fetches
+        answered = [r for r in search_results if _TEMPERATURE_RE.search(r.get('snippet', ''))]
+        if answered:
+            print(f"✅ Weather found in {len(answered)} search snippets, skipping scrape")
+            return [{
+                'url': r['url'],
+                'title': r['title'],
+                'content': r['snippet'],
+                'query_type': query_type
+            } for r in answered[:num_urls]]
+    
     scraped_results = []
+    candidates = search_results[:num_urls + 2]
+    
+    # Fetch every candidate at once, then keep the first num_urls successes in rank order
+    print(f"📄 Scraping {len(candidates)} pages in parallel...")
+    futures = [scrape_executor.submit(scrape_content, result['url']) for result in candidates]
     
-    for i, result in enumerate(search_results[:num_urls + 2]):
+    for i, (result, future) in enumerate(zip(candidates, futures)):
         url = result['url']
         title = result['title']
         
-        print(f"📄 [{i+1}/{min(len(search_results), num_urls+2)}] Scraping: {title[:50]}...")
-        content = scrape_content(url)
+        content = future.result()
+        print(f"📄 [{i+1}/{len(candidates)}] Scraped: {title[:50]}...")
         
         if content:
             scraped_results.append({
@@ -426,6 +471,9 @@ def search_and_scrape(query: str, num_urls: int = 3) -> List[Dict[str, str]]:
             print(f"   ✅ Successfully scraped {len(content)} chars")
             
             if len(scraped_results) >= num_urls:
+                # Lower-ranked pages still in flight aren't needed
+                for pending in futures[i + 1:]:
+                    pending.cancel()
                 break
         else:
             print(f"   ❌ Failed to scrape")
@@ -433,8 +481,9 @@ def search_and_scrape(query: str, num_urls: int = 3) -> List[Dict[str, str]]:
     print(f"✅ Total results: {len(scraped_results)}")
     return scraped_results
 
+@lru_cache(maxsize=2048)
 def categorize_query_type(query: str) -> str:
-    """Simple categorization for backward compatibility."""
+    """Simple categorization for backward compatibility (memoized per query)."""
     query_lower = query.lower()
     
     if any(word in query_lower for word in ["weather", "temperature", "rain", "snow", "forecast"]):
@@ -476,7 +525,7 @@ def is_content_fresh(timestamp_str: str, query_type: str, temporal_requirement:
     except Exception:
         return False
 
-def should_search_web(user_input: str, retrieved_memories: List[Dict[str, any]]) -> Dict[str, any]:
+def should_search_web(user_input: str, retrieved_memories: List[Memory]) -> Dict[str, any]:
     """
     Determine if web search is needed using LLM analysis with user context.
     """
@@ -489,10 +538,10 @@ def should_search_web(user_input: str, retrieved_memories: List[Dict[str, any]])
     fresh_items = 0
     
     for mem in retrieved_memories:
-        if mem.get("category") == "web_content":
+        if mem.category == "web_content":
             web_items += 1
             if is_content_fresh(
-                mem.get("timestamp", ""), 
+                mem.timestamp, 
                 analysis["query_type"],
                 analysis.get("temporal_requirement", "none")
             ):
@@ -520,9 +569,8 @@ if __name__ == "__main__":
     
     # Simulate memories with user context
     test_memories = [
-        {"content": "User: my name is Jack", "category": "user_message"},
-        {"content": "User: i work at renault", "category": "user_message"},
-        {"content": "User: my favorite color is blue", "category": "user_message"}
+        Memory(content=content, category="user_message", summary=content, timestamp="", score=0.0, title="")
+        for content in ["User: my name is Jack", "User: i work at renault", "User: my favorite color is blue"]
     ]
     
     test_queries = [